@@ -1,8 +1,22 @@
 # Author: Xinyu Ma
 
+import json
 import math
+import multiprocessing
+import os
 import random
 import time
+from multiprocessing import shared_memory
+
+try:
+    from . import instrumentation
+except ImportError:
+    import instrumentation
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 # Q1
 def radix_sort(num_list, b):
@@ -18,7 +32,10 @@ def radix_sort(num_list, b):
     Overall time complexity is O(NM)
     For space complexity, both count list and position list can be reused, so the actually space complexity can be smaller than O(M*base)
     So space complexity is O(base)
+    b can also be 'auto', then choose_base picks the base from the cost model
     """
+    if b == 'auto':
+        b = choose_base(num_list)
     # N: length of the list
     N = len(num_list)
     # make a copy of the num_list, prevent modification of original data
@@ -27,28 +44,30 @@ def radix_sort(num_list, b):
     ans_list = []
     still_need_stable_sort = True
     divisor = 1
+    # the largest number decides how many digits have to be sorted
+    max_num = max(cpnum_list) if N > 0 else 0
     while still_need_stable_sort:
         input_list = []
         # for each ith digit, we sort the num_list and put it in ans_list
         # here we init it
         ans_list = [0 for i in range(N)]
-        ith_num_all_zero = True
         # count each ith num 
         count = [0 for i in range(b)]
         for num in cpnum_list:
             ith_num = (num // divisor) % b
             input_list.append(ith_num)
             count[ith_num] += 1
-            if ith_num > 0:
-                ith_num_all_zero = False
         divisor = divisor * b
+        if instrumentation.enabled and N > 0:
+            # bucket skew: size of the largest bucket over the size of a bucket if the digits were even
+            instrumentation.count('radix_sort.passes')
+            instrumentation.observe('radix_sort.bucket_skew.b' + str(b), max(count) * b / N)
 
         # make position list
         position = [0 for i in range(b)]
         for i in range(1, b):
             position[i] = position[i-1] + count[i-1]
 
-        out_put = [0 for i in range(N)]
         # print("input_list:", input_list)
         for i in range(N):
             ans_list[position[input_list[i]]] = cpnum_list[i]
@@ -56,11 +75,309 @@ def radix_sort(num_list, b):
         # print("ans_list:", ans_list)
         cpnum_list = ans_list
 
-        if ith_num_all_zero:
+        # a digit can be zero for every number without being the last one,
+        # so stop only when the divisor has passed the largest number
+        if divisor > max_num:
             still_need_stable_sort = False
 
     return ans_list
 
+
+def radix_argsort(num_list, b):
+    """
+    This function returns the permutation that radix sort applies to num_list
+    num_list: list of unsorted integers, negative integers are allowed
+    b: base value, can be 'auto'
+    postcondition: [num_list[i] for i in radix_argsort(num_list, b)] is sorted in ascending order,
+    equal numbers keep their original order
+    implementation: the same stable sort on the k-th digit as radix_sort, but the indices are moved instead of the numbers
+    negative numbers are handled by adding a bias of -min(num_list) to every key, which does not change the order
+    Time complexity is O(NM), space complexity is O(N + base)
+    """
+    N = len(num_list)
+    if N == 0:
+        return []
+    min_num = min(num_list)
+    bias = -min_num if min_num < 0 else 0
+    keys = [num + bias for num in num_list] if bias > 0 else num_list
+    if b == 'auto':
+        b = choose_base(keys)
+    max_num = max(keys)
+    index = [i for i in range(N)]
+    divisor = 1
+    while True:
+        # count each ith num of the keys, in the current order of index
+        digits = [(keys[i] // divisor) % b for i in index]
+        count = [0 for i in range(b)]
+        for digit in digits:
+            count[digit] += 1
+        # make position list
+        position = [0 for i in range(b)]
+        for i in range(1, b):
+            position[i] = position[i-1] + count[i-1]
+        ans_index = [0 for i in range(N)]
+        for i in range(N):
+            ans_index[position[digits[i]]] = index[i]
+            position[digits[i]] += 1
+        index = ans_index
+        divisor = divisor * b
+        if divisor > max_num:
+            break
+    return index
+
+
+def radix_sort_records(keys, b, *payloads):
+    """
+    This function sorts keys by radix sort and moves every payload list along with them
+    keys: list of integers, negative integers are allowed
+    b: base value, can be 'auto'
+    payloads: lists of the same length as keys, for example the records the keys belong to
+    output: (sorted keys, payload lists in the same order as the sorted keys)
+    the records are never compared or copied into (key, record) pairs, only the permutation from radix_argsort is applied to each list
+    Time complexity is O(NM + NP) where P is the number of payload lists
+    """
+    index = radix_argsort(keys, b)
+    sorted_keys = [keys[i] for i in index]
+    sorted_payloads = [[payload[i] for i in index] for payload in payloads]
+    return (sorted_keys, sorted_payloads)
+
+
+def np_radix_sort(num_list, b):
+    """
+    This function performs the same LSD radix sort as radix_sort with NumPy
+    num_list: list of unsorted number, a uint64 NumPy array or any buffer of uint64
+    b: base value
+    precondition: keys must be non-negative integers
+    postcondition: keys are returned in ascending order, as a list if num_list is a list, otherwise as a uint64 array
+    implementation: each pass works on the whole array at once
+    digit extraction is floor_divide and remainder into preallocated buffers,
+    then the keys are moved by a stable ordering of the digits into the other of two ping-pong buffers
+    the ordering is a stable argsort of uint16 digits, which NumPy does with its own counting pass (count + prefix sum + scatter),
+    a digit of a base above 2^16 is ordered 16 bits at a time from the lowest bits, like a smaller LSD radix sort inside the pass,
+    so no pass falls back to a comparison sort
+    argsort has no out argument, so the order array is the only new allocation of a pass
+    a pass whose digits all fall into one bucket does not need to move anything, so it is skipped
+    if NumPy is missing or some key does not fit in 64 bits, radix_sort is used instead
+    Time complexity is O(NMS) where S = ceil(log2(base) / 16) is 1 for bases up to 2^16, space complexity is O(N + base)
+    """
+    is_list = isinstance(num_list, list)
+    if np is None:
+        return radix_sort(list(num_list), b)
+    if is_list:
+        if len(num_list) == 0:
+            return []
+        if min(num_list) < 0 or max(num_list) >= 2 ** 64:
+            return radix_sort(num_list, b)
+        src = np.array(num_list, dtype=np.uint64)
+    else:
+        if not isinstance(num_list, np.ndarray):
+            num_list = np.frombuffer(num_list, dtype=np.uint64)
+        src = np.array(num_list, dtype=np.uint64)
+    N = len(src)
+    if N == 0:
+        return [] if is_list else src
+    # the base is chosen on the uint64 keys, not on the bytes of a raw buffer, from the bases and cost model of this engine
+    if b == 'auto':
+        b = choose_base(src, engine='numpy')
+
+    # two ping-pong buffers for keys, two buffers for digit extraction, and the 16 bits of the digit being ordered
+    dst = np.empty_like(src)
+    quotient = np.empty_like(src)
+    digits = np.empty_like(src)
+    low = np.empty(N, dtype=np.uint16)
+    digit_bits = (b - 1).bit_length()
+    maxkey = int(src.max())
+    divisor = 1
+    while divisor <= maxkey:
+        np.floor_divide(src, np.uint64(divisor), out=quotient)
+        np.remainder(quotient, np.uint64(b), out=digits)
+        if digits.min() == digits.max():
+            # every key has the same digit, the order does not change
+            instrumentation.count('np_radix_sort.skipped_passes')
+            divisor *= b
+            continue
+        instrumentation.count('np_radix_sort.passes')
+        for shift in range(0, digit_bits, 16):
+            if shift > 0:
+                # the keys were moved by the lower bits, extract their digits again
+                np.floor_divide(src, np.uint64(divisor), out=quotient)
+                np.remainder(quotient, np.uint64(b), out=digits)
+                np.right_shift(digits, np.uint64(shift), out=digits)
+            # the unsafe cast keeps the lowest 16 bits
+            np.copyto(low, digits, casting='unsafe')
+            order = np.argsort(low, kind='stable')
+            np.take(src, order, out=dst)
+            src, dst = dst, src
+        divisor *= b
+
+    if is_list:
+        return [int(num) for num in src]
+    return src
+
+def _sort_bucket(task):
+    """
+    This function is run by the worker processes of parallel_radix_sort
+    task: (name of the shared memory, length of the array, start, end, base)
+    it sorts keys[start:end] of the shared array in place with np_radix_sort
+    """
+    shm_name, N, start, end, b = task
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        keys = np.ndarray((N,), dtype=np.uint64, buffer=shm.buf)
+        keys[start:end] = np_radix_sort(keys[start:end], b)
+        del keys
+    finally:
+        shm.close()
+
+
+def parallel_radix_sort(num_list, b=2 ** 16, workers=None, min_size=100000):
+    """
+    This function performs radix sort on num_list with a pool of processes
+    num_list: list of unsorted number, a uint64 NumPy array or any buffer of uint64
+    b: base value used by np_radix_sort inside each bucket, can be 'auto'
+    workers: number of processes, the number of cpus if it is None
+    min_size: lists shorter than this are sorted by np_radix_sort in this process
+    postcondition: same result as np_radix_sort
+    implementation:
+    first one MSD pass on the top bits of the largest key splits the keys into 4 * workers buckets,
+    every key in a bucket is smaller than every key in the next bucket, so the buckets can be sorted independently
+    the partitioned keys are written to one shared memory block,
+    each worker attaches to it and sorts its own bucket in place with the LSD routine, so no keys are pickled
+    Time complexity is O(NM / workers) plus the O(N) partition pass, space complexity is O(N)
+    """
+    if np is None:
+        return radix_sort(list(num_list), b)
+    is_list = isinstance(num_list, list)
+    if is_list:
+        if len(num_list) == 0:
+            return []
+        if min(num_list) < 0 or max(num_list) >= 2 ** 64:
+            return radix_sort(num_list, b)
+        keys = np.array(num_list, dtype=np.uint64)
+    elif isinstance(num_list, np.ndarray):
+        keys = np.asarray(num_list, dtype=np.uint64)
+    else:
+        keys = np.frombuffer(num_list, dtype=np.uint64)
+    N = len(keys)
+    if workers is None:
+        workers = multiprocessing.cpu_count()
+    if N < min_size or workers <= 1:
+        ans = np_radix_sort(keys, b)
+        return [int(num) for num in ans] if is_list else ans
+
+    # MSD partition on the top bits: bucket of key = key >> shift
+    # the buckets fit in 16 bits, so the stable ordering below is NumPy's counting sort, not a comparison sort
+    top_bits = min(max((4 * workers - 1).bit_length(), 1), 16)
+    shift = max(int(keys.max()).bit_length() - top_bits, 0)
+    bucket = (keys >> np.uint64(shift)).astype(np.uint16)
+    count = np.bincount(bucket, minlength=2 ** top_bits)
+    position = np.zeros(len(count) + 1, dtype=np.intp)
+    np.cumsum(count, out=position[1:])
+
+    shm = shared_memory.SharedMemory(create=True, size=N * 8)
+    try:
+        shared = np.ndarray((N,), dtype=np.uint64, buffer=shm.buf)
+        # the keys are scattered straight into shared memory, key k of bucket i lands at position[i] + k
+        np.take(keys, np.argsort(bucket, kind='stable'), out=shared)
+        tasks = [(shm.name, N, int(position[i]), int(position[i + 1]), b)
+                 for i in range(len(count)) if count[i] > 1]
+        # biggest buckets first, so one skewed bucket does not finish last
+        tasks.sort(key=lambda task: task[2] - task[3])
+        with multiprocessing.Pool(workers) as pool:
+            pool.map(_sort_bucket, tasks, chunksize=1)
+        ans = np.array(shared)
+        del shared
+    finally:
+        shm.close()
+        shm.unlink()
+    return [int(num) for num in ans] if is_list else ans
+
+
+def file_radix_sort(in_path, out_path, width=8, b=2 ** 16, chunk_size=2 ** 20):
+    """
+    This function performs radix sort on a binary file of fixed-width unsigned integers
+    in_path: file of little-endian unsigned integers
+    out_path: file the sorted integers are written to
+    width: bytes per integer, 1, 2, 4 or 8
+    b: base value
+    chunk_size: number of integers held in memory at once
+    postcondition: out_path holds the integers of in_path in ascending order, the number of integers is returned
+    implementation: both files are memory-mapped, nothing bigger than one chunk is read into memory
+    one chunked pass finds the largest key, which decides the number of digit passes
+    each digit pass first counts the digits chunk by chunk and makes the position list from the counts,
+    then scatters chunk by chunk: inside a chunk the keys are stably ordered by digit,
+    each key goes to position[digit] plus its rank among the keys of the same digit in the chunk,
+    and position is moved on by the counts of the chunk, so the pass is stable like radix_sort
+    the passes alternate between out_path and a temporary file next to it, arranged so the last pass writes out_path
+    Time complexity is O(NM), memory is O(chunk_size + base) besides the mapped files
+    """
+    if np is None:
+        raise ImportError('file_radix_sort needs numpy')
+    if os.path.getsize(in_path) == 0:
+        # an empty file cannot be memory-mapped
+        open(out_path, 'wb').close()
+        return 0
+    dtype = np.dtype('<u%d' % width)
+    src = np.memmap(in_path, dtype=dtype, mode='r')
+    N = len(src)
+    out = np.memmap(out_path, dtype=dtype, mode='w+', shape=(N,))
+
+    max_num = 0
+    for start in range(0, N, chunk_size):
+        max_num = max(max_num, int(src[start:start + chunk_size].max()))
+    passes = radix_passes(max_num, b)
+
+    tmp_path = out_path + '.tmp'
+    tmp = np.memmap(tmp_path, dtype=dtype, mode='w+', shape=(N,)) if passes > 1 else None
+    # the last pass has to write to out
+    dst = out if passes % 2 == 1 else tmp
+    divisor = 1
+    for _ in range(passes):
+        # count each digit
+        count = np.zeros(b, dtype=np.int64)
+        for start in range(0, N, chunk_size):
+            chunk = src[start:start + chunk_size].astype(np.uint64)
+            digits = ((chunk // np.uint64(divisor)) % np.uint64(b)).astype(np.intp)
+            count += np.bincount(digits, minlength=b)
+        # make position list
+        position = np.zeros(b, dtype=np.int64)
+        np.cumsum(count[:-1], out=position[1:])
+        # scatter chunk by chunk
+        for start in range(0, N, chunk_size):
+            chunk = np.array(src[start:start + chunk_size])
+            digits = ((chunk.astype(np.uint64) // np.uint64(divisor)) % np.uint64(b)).astype(np.intp)
+            order = np.argsort(digits, kind='stable')
+            sorted_digits = digits[order]
+            chunk_count = np.bincount(digits, minlength=b)
+            chunk_start = np.zeros(b, dtype=np.int64)
+            np.cumsum(chunk_count[:-1], out=chunk_start[1:])
+            rank = np.arange(len(chunk)) - chunk_start[sorted_digits]
+            dst[position[sorted_digits] + rank] = chunk[order]
+            position += chunk_count
+        dst.flush()
+        src, dst = dst, (tmp if dst is out else out)
+        divisor *= b
+
+    del src, dst, out, tmp
+    if passes > 1:
+        os.remove(tmp_path)
+    return N
+
+
+def iter_keys(path, width=8, chunk_size=2 ** 20):
+    """
+    This generator yields the integers of a binary file written by file_radix_sort one by one
+    only one chunk of the memory-mapped file is converted at a time
+    """
+    if np is None:
+        raise ImportError('iter_keys needs numpy')
+    if os.path.getsize(path) == 0:
+        return
+    keys = np.memmap(path, dtype=np.dtype('<u%d' % width), mode='r')
+    for start in range(0, len(keys), chunk_size):
+        for num in keys[start:start + chunk_size].tolist():
+            yield num
+
 # Q2
 def time_radix_sort():
     """
@@ -68,24 +385,192 @@ def time_radix_sort():
     """
     test_data = [random.randint(1, (2 ** 64) - 1) for _ in range(100000)]
     to_return = []
-    # traverse all base from 2 to 30
     # record time of radix sort
-    for base in range(2,30):
+    for base in radix_bases():
         start_time = time.time()
         ans_data = radix_sort(test_data, base)
         end_time = time.time()
         to_return.append((base, end_time - start_time))
+    return to_return
 
-    base = 30
-    while base < 1000000:
+
+def time_parallel_radix_sort(workers_list=(1, 2, 4, 8), N=4000000):
+    """
+    This function generates test data and test the time of parallel_radix_sort under different numbers of workers
+    """
+    test_data = np.random.randint(0, 2 ** 63, size=N, dtype=np.uint64)
+    to_return = []
+    for workers in workers_list:
         start_time = time.time()
-        ans_data = radix_sort(test_data, base)
+        ans_data = parallel_radix_sort(test_data, workers=workers)
         end_time = time.time()
-        to_return.append((base, end_time - start_time))
-        base *= 3
+        to_return.append((workers, end_time - start_time))
     return to_return
 
 
+def radix_bases():
+    """
+    This function returns the bases measured by time_radix_sort and calibrate_radix_sort
+    all base from 2 to 29, then 30 multiplied by 3 until 1000000
+    """
+    bases = list(range(2, 30))
+    base = 30
+    while base < 1000000:
+        bases.append(base)
+        base *= 3
+    return bases
+
+
+def np_radix_bases():
+    """
+    This function returns the bases measured by calibrate_np_radix_sort and tried by choose_base for np_radix_sort
+    powers of two from 2 to 2^16, digits below 2^16 are ordered by NumPy's own counting sort,
+    a larger base only adds passes inside np_radix_sort
+    """
+    return [2 ** k for k in range(1, 17)]
+
+
+def radix_passes(max_num, b):
+    """
+    This function returns the number of stable sort passes radix_sort makes
+    it is the number of digits of max_num in base b, and at least 1
+    Time complexity is O(M) where M is the number of digits
+    """
+    passes = 1
+    divisor = b
+    while divisor <= max_num:
+        divisor *= b
+        passes += 1
+    return passes
+
+
+# cost model used by radix_sort(num_list, 'auto')
+# 'bases' is a list of [base, a, c], one pass over N numbers in that base costs a * N + c seconds
+# None means no calibration has been loaded, then a pass is assumed to cost N + base
+radix_cost_model = None
+# the same for np_radix_sort(num_list, 'auto'), fitted by calibrate_np_radix_sort, the two engines do not share a model
+np_radix_cost_model = None
+
+
+def fit_pass_cost(points):
+    """
+    This function fits a and c of t = a * N + c by least squares to the (N, t) points of one base
+    """
+    k = len(points)
+    mean_n = sum(n for n, _ in points) / k
+    mean_t = sum(t for _, t in points) / k
+    var_n = sum((n - mean_n) ** 2 for n, _ in points)
+    a = sum((n - mean_n) * (t - mean_t) for n, t in points) / var_n if var_n > 0 else mean_t / mean_n
+    c = max(mean_t - a * mean_n, 0.0)
+    return max(a, 0.0), c
+
+
+def calibrate_radix_sort(path=None, sizes=(1000, 10000, 50000)):
+    """
+    This function measures radix_sort and saves the cost model used by choose_base
+    path: if given, the model is written to this file as json
+    sizes: list lengths to measure for every base
+    implementation: like time_radix_sort, but each time is divided by radix_passes to get the cost of one pass
+    then for each base, a and c of a * N + c are fitted by least squares over the sizes
+    the model becomes radix_cost_model and is also returned
+    """
+    global radix_cost_model
+    test_data = [random.randint(1, (2 ** 64) - 1) for _ in range(max(sizes))]
+    model = {'engine': 'python', 'bases': []}
+    for base in radix_bases():
+        points = []
+        for N in sizes:
+            start_time = time.time()
+            radix_sort(test_data[:N], base)
+            end_time = time.time()
+            points.append((N, (end_time - start_time) / radix_passes(max(test_data[:N]), base)))
+        # least squares fit of t = a * N + c
+        a, c = fit_pass_cost(points)
+        model['bases'].append([base, a, c])
+    if path is not None:
+        with open(path, 'w') as file:
+            json.dump(model, file)
+    radix_cost_model = model
+    return model
+
+
+def calibrate_np_radix_sort(path=None, sizes=(100000, 1000000, 4000000)):
+    """
+    This function measures np_radix_sort over np_radix_bases and saves the cost model used by choose_base for it
+    path: if given, the model is written to this file as json
+    sizes: array lengths to measure for every base
+    the fit is the same as calibrate_radix_sort, the model becomes np_radix_cost_model and is also returned
+    """
+    global np_radix_cost_model
+    if np is None:
+        raise ImportError('calibrate_np_radix_sort needs numpy')
+    test_data = np.random.randint(1, 2 ** 63, size=max(sizes), dtype=np.uint64)
+    model = {'engine': 'numpy', 'bases': []}
+    for base in np_radix_bases():
+        points = []
+        for N in sizes:
+            start_time = time.time()
+            np_radix_sort(test_data[:N], base)
+            end_time = time.time()
+            points.append((N, (end_time - start_time) / radix_passes(int(test_data[:N].max()), base)))
+        a, c = fit_pass_cost(points)
+        model['bases'].append([base, a, c])
+    if path is not None:
+        with open(path, 'w') as file:
+            json.dump(model, file)
+    np_radix_cost_model = model
+    return model
+
+
+def load_radix_model(path):
+    """
+    This function loads a cost model saved by calibrate_radix_sort or calibrate_np_radix_sort
+    into radix_cost_model or np_radix_cost_model, by the 'engine' of the model (models without one are for radix_sort)
+    """
+    global radix_cost_model, np_radix_cost_model
+    with open(path) as file:
+        model = json.load(file)
+    if model.get('engine') == 'numpy':
+        np_radix_cost_model = model
+    else:
+        radix_cost_model = model
+    return model
+
+
+def choose_base(num_list, model=None, engine='python'):
+    """
+    This function chooses the base with the smallest predicted cost for radix sort of num_list
+    model: cost model, radix_cost_model (np_radix_cost_model for engine 'numpy') is used if it is None
+    engine: 'python' for radix_sort, 'numpy' for np_radix_sort, whose bases are np_radix_bases
+    the predicted cost of a base is radix_passes(max, base) * (a * N + c)
+    without a calibrated model, every base of radix_bases (or np_radix_bases) is tried with a * N + c == N + base
+    num_list can be a list or a NumPy array, whose largest key is found with .max() instead of a Python loop
+    Time complexity is O(N + B * M) where B is the number of bases
+    """
+    if model is None:
+        model = np_radix_cost_model if engine == 'numpy' else radix_cost_model
+    N = len(num_list)
+    if N == 0:
+        max_num = 0
+    elif np is not None and isinstance(num_list, np.ndarray):
+        max_num = int(num_list.max())
+    else:
+        max_num = int(max(num_list))
+    if model is None:
+        bases = np_radix_bases() if engine == 'numpy' else radix_bases()
+        candidates = [(base, 1.0, float(base)) for base in bases]
+    else:
+        candidates = model['bases']
+    best_base = 10
+    best_cost = -1
+    for base, a, c in candidates:
+        cost = radix_passes(max_num, base) * (a * N + c)
+        if best_cost == -1 or cost < best_cost:
+            best_cost = cost
+            best_base = base
+    return best_base
+
+
 # Q3
 def strtoint(string):
     '''
@@ -115,19 +600,72 @@ def inttostr(integer):
 
 def str_radix_sort(string_list):
     '''
-    This function performs radix sort after converting string into integer and return string
-    Time complexity is same as radix_sort
+    This function sorts strings in the same order as radix sort on their base 27 integers:
+    shorter strings first, strings of the same length in alphabetical order
+    It used to convert every string with strtoint, sort the integers and convert back with inttostr,
+    now it uses msd_str_radix_sort on the characters directly
+    Time complexity is O(C) where C is the total number of characters
     '''
-    num_list = []
-    for string in string_list:
-        num_list.append(strtoint(string))
+    return msd_str_radix_sort(string_list)
 
-    num_list = radix_sort(num_list, 100)
-    strings = []
-    for num in num_list:
-        strings.append(inttostr(num))
 
-    return strings
+def insertion_sort(string_list):
+    '''
+    This function sorts a short list of strings in place by insertion sort
+    Time complexity is O(N^2) comparisons, so it is only used for small buckets
+    '''
+    for i in range(1, len(string_list)):
+        string = string_list[i]
+        j = i - 1
+        while j >= 0 and string_list[j] > string:
+            string_list[j + 1] = string_list[j]
+            j -= 1
+        string_list[j + 1] = string
+    return string_list
+
+
+def msd_str_radix_sort(string_list, cutoff=16):
+    '''
+    This function performs MSD radix sort on the characters of the strings
+    string_list: a list of strings (or bytes)
+    cutoff: buckets with at most this many strings are finished by insertion sort
+    postcondition: same order as str_radix_sort, shorter strings first, then alphabetical order
+    implementation:
+    first the strings are put into one bucket per length, which gives the order by length
+    inside a length group every string has a character at each depth, so no end of string bucket is needed
+    a group is split on the character at depth d, each non-empty bucket is split again at depth d + 1,
+    buckets are kept on a stack instead of recursion, so long strings cannot hit the recursion limit
+    the buckets are pushed in reverse order, so they come off the stack and reach ans in order
+    the strings in a small bucket share their first d characters, so insertion sort finishes it quickly
+    Time complexity is O(C) where C is the total number of characters, space complexity is O(N + L) where L is the longest length
+    '''
+    if len(string_list) == 0:
+        return []
+    by_length = [[] for _ in range(max(len(string) for string in string_list) + 1)]
+    for string in string_list:
+        by_length[len(string)].append(string)
+
+    ans = []
+    for group in by_length:
+        stack = [(group, 0)]
+        while stack:
+            bucket, d = stack.pop()
+            if len(bucket) <= 1 or d >= len(bucket[0]):
+                ans += bucket
+            elif len(bucket) <= cutoff:
+                ans += insertion_sort(bucket)
+            else:
+                buckets = {}
+                for string in bucket:
+                    ch = string[d]
+                    if ch in buckets:
+                        buckets[ch].append(string)
+                    else:
+                        buckets[ch] = [string]
+                # at most one bucket per character of the alphabet
+                for ch in sorted(buckets, reverse=True):
+                    stack.append((buckets[ch], d + 1))
+    return ans
 
 
 
@@ -174,6 +712,7 @@ def find_rotations(string_list, p):
 
 
     # merge the results and pick out duplicate strings
+    # both lists are in str_radix_sort order (by length, then alphabetical), so compare in that order too
     ans = []
     i = j = 0
     while i < N and j < N:
@@ -181,13 +720,116 @@ def find_rotations(string_list, p):
             ans.append(sorted_string_list[i])
             i += 1
             j += 1
-        elif( j == N or sorted_string_list[i] < sorted_rotated_string_list[j]):
+        elif( j == N or (len(sorted_string_list[i]), sorted_string_list[i]) < (len(sorted_rotated_string_list[j]), sorted_rotated_string_list[j])):
             i += 1
-        elif( i == N or sorted_string_list[i] > sorted_rotated_string_list[j]):
+        else:
             j += 1
     return ans
 
 
+def least_rotation(string):
+    '''
+    This function returns the start of the lexicographically least rotation of string (Booth's algorithm)
+    Time complexity is O(N) where N is the length of string
+    '''
+    doubled = string + string
+    n = len(doubled)
+    failure = [-1] * n
+    k = 0
+    for j in range(1, n):
+        ch = doubled[j]
+        i = failure[j - k - 1]
+        while i != -1 and ch != doubled[k + i + 1]:
+            if ch < doubled[k + i + 1]:
+                k = j - i - 1
+            i = failure[i]
+        if ch != doubled[k + i + 1]:
+            # here i == -1
+            if ch < doubled[k]:
+                k = j
+            failure[j - k] = -1
+        else:
+            failure[j - k] = i + 1
+    return k
+
+
+class RotationIndex(object):
+    '''
+    Index over a fixed string_list that answers find_rotations for many p without sorting again
+    the strings are sorted once by str_radix_sort and counted once in a dictionary
+    '''
+    def __init__(self, string_list):
+        '''
+        string_list: a list of strings
+        order: the distinct strings in str_radix_sort order
+        count: the number of times each string appears in string_list
+        time complexity: O(C) where C is the total number of characters
+        space complexity: O(C)
+        '''
+        self.count = {}
+        for string in string_list:
+            self.count[string] = self.count.get(string, 0) + 1
+        self.order = str_radix_sort(list(self.count))
+
+    def rotations(self, p):
+        '''
+        This function returns the same list as find_rotations(string_list, p)
+        every distinct string is reverse p-rotated once and looked up in count,
+        a string appears in the answer min(its count, count of strings rotating into it) times
+        time complexity: O(C) where C is the total number of characters of the distinct strings
+        '''
+        return self.rotations_many([p])[p]
+
+    def rotations_many(self, ps):
+        '''
+        This function answers rotations(p) for every p in ps, returned as a dictionary from p to the answer
+        p only matters modulo the length of a string, so each string is rotated once per distinct shift
+        time complexity: O(K * C) in the worst case where K is the number of distinct p
+        '''
+        answers = {}
+        rotated_cache = {}
+        for p in ps:
+            if p in answers:
+                continue
+            rotated_count = {}
+            for string in self.order:
+                l = len(string)
+                shift = p % l if l > 0 else 0
+                key = (string, shift)
+                if key not in rotated_cache:
+                    rotated_cache[key] = rotate_string([string], shift)[0] if l > 0 else string
+                rotated = rotated_cache[key]
+                if rotated in self.count:
+                    rotated_count[rotated] = rotated_count.get(rotated, 0) + self.count[string]
+            ans = []
+            for string in self.order:
+                if string in rotated_count:
+                    ans += [string] * min(self.count[string], rotated_count[string])
+            answers[p] = ans
+        return answers
+
+    def rotation_classes(self):
+        '''
+        This function groups the strings by their least rotation in a single pass
+        two strings share a rotation class exactly when they have the same least rotation
+        output: a list of classes with more than one string in string_list, each class is a list of its distinct strings in str_radix_sort order
+        time complexity: O(C) where C is the total number of characters
+        '''
+        classes = {}
+        for string in self.order:
+            k = least_rotation(string)
+            canonical = string[k:] + string[:k]
+            if canonical in classes:
+                classes[canonical].append(string)
+            else:
+                classes[canonical] = [string]
+        ans = []
+        for members in classes.values():
+            if sum(self.count[string] for string in members) > 1:
+                ans.append(members)
+        return ans
+
+
 def main():
     b = 10
     num_list = [18446744073709551615,
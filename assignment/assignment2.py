@@ -1,5 +1,22 @@
 # Author: Xinyu Ma
 
+import heapq
+import multiprocessing
+import os
+import random
+import tempfile
+import time
+
+try:
+    from . import instrumentation
+except ImportError:
+    import instrumentation
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
 dx = [-1, -1, -1, 0, 0, 1, 1, 1]
 dy = [-1, 0, 1, 1, -1, -1, 0, 1]
 
@@ -49,6 +66,85 @@ def longest_oscillation(alist):
     return (len(ans), ans)
 
 
+class OscillationAccumulator(object):
+    '''
+    longest_oscillation for a stream, the values are given one at a time with push(x)
+    it keeps the same state as the last two entries of ans in longest_oscillation:
+    last: the value at ans[-1], direction: 1 if the oscillation went up to last, -1 if down, 0 if it has only one value so far
+    record: keep ans as well, otherwise only O(1) memory is used
+    '''
+    def __init__(self, record=False):
+        self.count = 0
+        self.length = 0
+        self.last = None
+        self.direction = 0
+        self.record = record
+        self.ans = [] if record else None
+
+    def push(self, x):
+        '''
+        add the next value of the stream
+        a value in the same direction replaces the end of the oscillation, a value in the other direction extends it,
+        an equal value changes nothing
+        time complexity: O(1)
+        '''
+        pos = self.count
+        self.count += 1
+        if pos == 0:
+            self.last = x
+            self.length = 1
+            if self.record:
+                self.ans.append(pos)
+            return self.length
+        if x == self.last:
+            return self.length
+        direction = 1 if x > self.last else -1
+        if direction == self.direction:
+            # to the same direction
+            if self.record:
+                self.ans[-1] = pos
+        else:
+            # first move, or a turn
+            self.direction = direction
+            self.length += 1
+            if self.record:
+                self.ans.append(pos)
+        self.last = x
+        return self.length
+
+    def result(self):
+        '''
+        output: the same as longest_oscillation of the values pushed so far, the list of indices is None if record is False
+        '''
+        return (self.length, list(self.ans) if self.record else None)
+
+
+def np_oscillation_lengths(X):
+    '''
+    input: X: a 2-D array, one series per row
+    output: array of the lengths longest_oscillation returns for each row
+    implementation:
+    the length is the number of turns plus 2 when the series moves at all, 1 when all values are equal
+    d is the direction of each step (1 up, -1 down, 0 equal), zeros (equal values) are skipped by carrying the last nonzero sign forward,
+    a turn is a nonzero sign different from the last nonzero sign before it
+    time complexity: O(k*t) for k series of length t
+    space complexity: O(k*t)
+    '''
+    X = np.asarray(X)
+    k, t = X.shape
+    if t == 0:
+        return np.zeros(k, dtype=np.int64)
+    # comparisons instead of np.sign(np.diff(X)), a difference of unsigned values wraps around
+    d = (X[:, 1:] > X[:, :-1]).astype(np.int8) - (X[:, 1:] < X[:, :-1])
+    # index of the last nonzero sign up to each position, 0 if there is none (then d[0] is 0 or the first sign)
+    last = np.where(d != 0, np.arange(t - 1), 0)
+    np.maximum.accumulate(last, axis=1, out=last)
+    carried = np.take_along_axis(d, last, axis=1)
+    turns = np.count_nonzero((d[:, 1:] != 0) & (carried[:, :-1] != 0) & (d[:, 1:] != carried[:, :-1]), axis=1)
+    moves = np.any(d != 0, axis=1)
+    return 1 + moves + turns
+
+
 # Problem 2
 def length(M, step_len, i, j):
     '''
@@ -60,10 +156,15 @@ def length(M, step_len, i, j):
     when determining the walk, we traverse the 8 surrounding locations and record it as nx, ny
     if M[nx][ny] at this location is smaller than M[i][j], pass
     the maximum value of step_len[nx][ny] + 1 is the step_len[i][j]
+    when instrumentation is enabled, calls answered from step_len count as walk.memo_hits, the others as walk.memo_misses
     '''
     if step_len[i][j] != -1:
+        if instrumentation.enabled:
+            instrumentation.count('walk.memo_hits')
         return step_len[i][j]
-    
+    if instrumentation.enabled:
+        instrumentation.count('walk.memo_misses')
+
     maxstep = -1
     for direction in range(8):
         nx = i + dx[direction]
@@ -127,27 +228,383 @@ def longest_walk(M):
     maxstep = -1
     maxposx = -1
     maxposy = -1
-    for i in range(len(M)):
-        for j in range(len(M[0])):
-            tl = length(M, step_len, i, j)   # length() is used to determine the walk of M[i][j]
-            if tl > maxstep:
-                maxstep = tl
-                maxposx = i 
-                maxposy = j
+    with instrumentation.phase('walk.build'):
+        for i in range(len(M)):
+            for j in range(len(M[0])):
+                tl = length(M, step_len, i, j)   # length() is used to determine the walk of M[i][j]
+                if tl > maxstep:
+                    maxstep = tl
+                    maxposx = i 
+                    maxposy = j
     # backtracking path:
     ans = []
     nowstepsize = maxstep
     nowx = maxposx
     nowy = maxposy
     ans.append((nowx, nowy))
-    while True:
-        nowx, nowy = nextxy(step_len, nowx, nowy)
+    with instrumentation.phase('walk.backtrack'):
+        while nowstepsize > 1:
+            nowx, nowy = nextxy(step_len, nowx, nowy)
+            ans.append((nowx, nowy))
+            nowstepsize = step_len[nowx][nowy]
+    return (len(ans), ans[::-1])
+
+
+def np_step_len(A, base=None):
+    '''
+    input: A: a 2-D NumPy array
+    base: optional 2-D array of lower bounds for step_len, used by tiled_longest_walk for cells whose neighbours are outside A
+    output: step_len as a 2-D array, the same values as length() fills in (when base is None)
+    implementation:
+    instead of recursion, the cells are finished in dependency order (Kahn's algorithm on the walk graph):
+    count[c] is the number of neighbours smaller than cell c, counted with the 8 shifted views of A
+    cells with count 0 have nothing smaller around them, their step_len is 1 (or base), they are the first frontier
+    when a frontier is finished, every larger neighbour of its cells gets at least the step_len of the cell plus one,
+    and loses one from count, the neighbours whose count reaches 0 form the next frontier,
+    all their smaller neighbours are finished by then, so their step_len is final too
+    each frontier is handled by whole array operations, cells of equal value never depend on each other
+    time complexity: O(n*m) array work, plus O(L) rounds where L is the longest walk
+    space complexity: O(n*m)
+    '''
+    n, m = A.shape
+    flat = A.ravel()
+    count = np.zeros((n, m), dtype=np.int64)
+    for direction in range(8):
+        cell, neighbour = shifted_views(n, m, dx[direction], dy[direction])
+        count[cell] += A[neighbour] < A[cell]
+    count = count.ravel()
+    if base is None:
+        step_len = np.ones(n * m, dtype=np.int64)
+    else:
+        step_len = np.maximum(np.asarray(base, dtype=np.int64), 1).ravel()
+    frontier = np.flatnonzero(count == 0)
+    while len(frontier) > 0:
+        instrumentation.count('walk.frontier_rounds')
+        rows = frontier // m
+        cols = frontier % m
+        sources = []
+        targets = []
+        for direction in range(8):
+            nx = rows + dx[direction]
+            ny = cols + dy[direction]
+            inside = (nx >= 0) & (nx < n) & (ny >= 0) & (ny < m)
+            source = frontier[inside]
+            target = nx[inside] * m + ny[inside]
+            larger = flat[target] > flat[source]
+            sources.append(source[larger])
+            targets.append(target[larger])
+        sources = np.concatenate(sources)
+        targets = np.concatenate(targets)
+        np.maximum.at(step_len, targets, step_len[sources] + 1)
+        np.subtract.at(count, targets, 1)
+        frontier = np.unique(targets[count[targets] == 0])
+    return step_len.reshape(n, m)
+
+
+def shifted_views(n, m, ddx, ddy):
+    '''
+    return the slices (cell, neighbour) of an n*m array such that A[neighbour] is the neighbour at (i+ddx, j+ddy) of each cell in A[cell]
+    '''
+    cell = (slice(max(0, -ddx), n - max(0, ddx)), slice(max(0, -ddy), m - max(0, ddy)))
+    neighbour = (slice(max(0, ddx), n - max(0, -ddx)), slice(max(0, ddy), m - max(0, -ddy)))
+    return cell, neighbour
+
+
+def np_longest_walk(M):
+    '''
+    input: M: a matrix (list of lists or 2-D NumPy array)
+    output: the same as longest_walk(M), without recursion, so large grids do not reach the recursion limit
+    step_len comes from np_step_len
+    backtracking uses the same rule as nextxy, from the first cell with the largest step_len,
+    go to the first of the 8 directions whose step_len is one less, the 8 directions are checked at once
+    time complexity: O(n*m)
+    space complexity: O(n*m)
+    '''
+    if np is None:
+        return longest_walk(M)
+    A = np.asarray(M)
+    n, m = A.shape
+    with instrumentation.phase('walk.build'):
+        step_len = np_step_len(A)
+    pos = int(np.argmax(step_len))
+    nowx, nowy = pos // m, pos % m
+    ddx = np.array(dx)
+    ddy = np.array(dy)
+    padded = np.full((n + 2, m + 2), -1, dtype=np.int64)
+    padded[1:n + 1, 1:m + 1] = step_len
+    ans = [(nowx, nowy)]
+    nowstepsize = int(step_len[nowx, nowy])
+    while nowstepsize > 1:
+        around = padded[nowx + 1 + ddx, nowy + 1 + ddy]
+        direction = int(np.argmax(around == nowstepsize - 1))
+        nowx, nowy = nowx + dx[direction], nowy + dy[direction]
         ans.append((nowx, nowy))
-        nowstepsize = step_len[nowx][nowy]
-        if nowstepsize == 1:
-            break
+        nowstepsize -= 1
     return (len(ans), ans[::-1])
 
+# arrays opened by each worker process of tiled_longest_walk
+tile_arrays = None
+
+
+def open_tile_arrays(a_info, step_info):
+    '''
+    initializer of the worker processes of tiled_longest_walk, opens the memory-mapped grid and step_len once per process
+    a_info, step_info: (filename, dtype, shape, offset) of each np.memmap
+    '''
+    global tile_arrays
+    tile_arrays = tuple(np.memmap(filename, dtype=dtype, mode='r', shape=shape, offset=offset)
+                        for filename, dtype, shape, offset in (a_info, step_info))
+
+
+def walk_tile(task, A=None, step_len=None):
+    '''
+    compute step_len of the cells in rows r0:r1 and columns c0:c1 of the grid
+    task: (r0, r1, c0, c1)
+    A, step_len: the grid and the current step_len, the arrays from open_tile_arrays if None
+    the tile is read with a halo of one cell on each side,
+    np_step_len runs on the block with the current step_len as base, so cells next to the halo start from what the halo already has
+    every value found is the length of a real walk, so it never goes above the final step_len
+    output: (task, step_len of the tile), only the inner cells are returned
+    time complexity: O(t^2) for a t*t tile
+    '''
+    if A is None:
+        A, step_len = tile_arrays
+    r0, r1, c0, c1 = task
+    n, m = A.shape
+    h0, h1 = max(r0 - 1, 0), min(r1 + 1, n)
+    w0, w1 = max(c0 - 1, 0), min(c1 + 1, m)
+    block = np_step_len(np.asarray(A[h0:h1, w0:w1]), np.asarray(step_len[h0:h1, w0:w1]))
+    return task, block[r0 - h0:r1 - h0, c0 - w0:c1 - w0]
+
+
+def tiled_longest_walk(A, tile=1024, step_path=None, workers=None):
+    '''
+    input: A: a 2-D array, normally an np.memmap of a raster that does not fit in memory
+    tile: side of the square tiles
+    step_path: file for the memory-mapped step_len, a temporary file if None
+    workers: number of processes for the tiles of one round, tiles run in this process if None or 1 (A must be an np.memmap to use workers)
+    output: the same as longest_walk(A)
+    implementation:
+    step_len lives in a memory-mapped file, starting at 0 everywhere
+    in each round, every dirty tile is recomputed by walk_tile with a halo of one cell taken from step_len,
+    a walk can cross tile borders, so a tile whose cells changed makes its 8 neighbouring tiles dirty for the next round,
+    rounds go on until no cell changes, then step_len is the same as in longest_walk
+    in one round the tiles only read step_len written by earlier rounds, so they can run in a process pool
+    the cell with the largest step_len and the path are found as in longest_walk, reading only a few rows or cells at a time
+    time complexity: O(R * n * m) where R is the number of rounds, R is small unless walks wind through many tiles
+    space complexity: O(tile^2) in memory, step_len takes 8 * n * m bytes on disk
+    '''
+    n, m = A.shape
+    remove_step_file = step_path is None
+    if step_path is None:
+        handle, step_path = tempfile.mkstemp(suffix='.step')
+        os.close(handle)
+    step_len = np.memmap(step_path, dtype=np.int64, mode='w+', shape=(n, m))
+    tiles_x = (n + tile - 1) // tile
+    tiles_y = (m + tile - 1) // tile
+    pool = None
+    if workers is not None and workers > 1:
+        a_info = (A.filename, A.dtype, A.shape, A.offset)
+        step_info = (step_path, step_len.dtype, step_len.shape, 0)
+        pool = multiprocessing.Pool(workers, initializer=open_tile_arrays, initargs=(a_info, step_info))
+    try:
+        dirty = set((tx, ty) for tx in range(tiles_x) for ty in range(tiles_y))
+        while dirty:
+            tasks = [(tx * tile, min((tx + 1) * tile, n), ty * tile, min((ty + 1) * tile, m)) for tx, ty in sorted(dirty)]
+            if pool is not None:
+                step_len.flush()
+                results = pool.imap_unordered(walk_tile, tasks)
+            else:
+                results = (walk_tile(task, A, step_len) for task in tasks)
+            changed = []
+            for (r0, r1, c0, c1), block in results:
+                if (block != step_len[r0:r1, c0:c1]).any():
+                    step_len[r0:r1, c0:c1] = block
+                    changed.append((r0 // tile, c0 // tile))
+            dirty = set()
+            for tx, ty in changed:
+                for ddx in (-1, 0, 1):
+                    for ddy in (-1, 0, 1):
+                        if 0 <= tx + ddx < tiles_x and 0 <= ty + ddy < tiles_y and (ddx, ddy) != (0, 0):
+                            dirty.add((tx + ddx, ty + ddy))
+
+        # first cell with the largest step_len, in row order like longest_walk
+        # the scan reads one tile at a time, the first maximum of a tile is its first in row order,
+        # across tiles an equal maximum only wins if its cell comes earlier in row order
+        maxstep = -1
+        maxposx = maxposy = -1
+        for r0 in range(0, n, tile):
+            for c0 in range(0, m, tile):
+                block = np.asarray(step_len[r0:r0 + tile, c0:c0 + tile])
+                pos = int(np.argmax(block))
+                value = int(block.flat[pos])
+                x, y = r0 + pos // block.shape[1], c0 + pos % block.shape[1]
+                if value > maxstep or (value == maxstep and (x, y) < (maxposx, maxposy)):
+                    maxstep = value
+                    maxposx, maxposy = x, y
+        # backtracking path, the same rule as nextxy
+        ans = [(maxposx, maxposy)]
+        nowx, nowy = maxposx, maxposy
+        nowstepsize = maxstep
+        while nowstepsize > 1:
+            for direction in range(8):
+                nx = nowx + dx[direction]
+                ny = nowy + dy[direction]
+                if 0 <= nx < n and 0 <= ny < m and step_len[nx, ny] == nowstepsize - 1:
+                    break
+            nowx, nowy = nx, ny
+            ans.append((nowx, nowy))
+            nowstepsize -= 1
+        return (len(ans), ans[::-1])
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+        del step_len
+        if remove_step_file:
+            os.remove(step_path)
+
+class WalkSolver(object):
+    '''
+    keeps step_len of a grid between edits, so longest_walk can be asked again after small changes
+    M: the grid, step_len: same as in longest_walk
+    cells: for each step length, the set of cells with that step length, so the longest walk is found without scanning the grid
+    '''
+    def __init__(self, M):
+        '''
+        build step_len with the cells in increasing order of value:
+        when a cell is reached all its smaller neighbours already have their step_len, so no recursion is needed
+        time complexity: O(n*m*log(n*m))
+        space complexity: O(n*m)
+        '''
+        self.M = [list(row) for row in M]
+        self.n = len(self.M)
+        self.m = len(self.M[0])
+        self.step_len = [[0 for j in range(self.m)] for i in range(self.n)]
+        self.cells = {}
+        order = sorted((self.M[i][j], i, j) for i in range(self.n) for j in range(self.m))
+        for _, i, j in order:
+            self.set_step(i, j, self.cell_step(i, j))
+
+    def cell_step(self, i, j):
+        '''
+        step_len of (i, j) from the step_len of its smaller neighbours, one step of length()
+        time complexity: O(1)
+        '''
+        maxstep = 0
+        for direction in range(8):
+            nx = i + dx[direction]
+            ny = j + dy[direction]
+            if 0 <= nx < self.n and 0 <= ny < self.m and self.M[nx][ny] < self.M[i][j]:
+                maxstep = max(maxstep, self.step_len[nx][ny])
+        return maxstep + 1
+
+    def set_step(self, i, j, step):
+        '''
+        change step_len of (i, j) and move the cell to its new set in cells
+        time complexity: O(1)
+        '''
+        old = self.step_len[i][j]
+        if old in self.cells:
+            self.cells[old].discard((i, j))
+            if len(self.cells[old]) == 0:
+                del self.cells[old]
+        self.step_len[i][j] = step
+        if step in self.cells:
+            self.cells[step].add((i, j))
+        else:
+            self.cells[step] = {(i, j)}
+
+    def update(self, i, j, value):
+        '''
+        set M[i][j] to value and recompute the step_len that can change
+        '''
+        self.update_patch(i, j, [[value]])
+
+    def update_patch(self, i, j, patch):
+        '''
+        copy the rectangle patch into M with its top left corner at (i, j) and recompute the step_len that can change
+        implementation:
+        only the edited cells and their neighbours have different smaller neighbours than before, they are the seeds
+        the seeds go into a heap ordered by value, a cell taken from the heap gets cell_step again,
+        if its step_len changes, its larger neighbours are pushed, since their step_len may depend on it
+        smaller values come out first, so every cell is recomputed after all its smaller neighbours are final
+        the work stops where step_len stops changing, which is inside the cells reachable by increasing walks from the edit
+        time complexity: O(K*log(K)) where K is the number of cells recomputed
+        '''
+        seeds = set()
+        for pi in range(len(patch)):
+            for pj in range(len(patch[0])):
+                x, y = i + pi, j + pj
+                self.M[x][y] = patch[pi][pj]
+                seeds.add((x, y))
+                for direction in range(8):
+                    nx = x + dx[direction]
+                    ny = y + dy[direction]
+                    if 0 <= nx < self.n and 0 <= ny < self.m:
+                        seeds.add((nx, ny))
+        heap = [(self.M[x][y], x, y) for x, y in seeds]
+        heapq.heapify(heap)
+        queued = set(seeds)
+        while heap:
+            _, x, y = heapq.heappop(heap)
+            queued.discard((x, y))
+            step = self.cell_step(x, y)
+            if step == self.step_len[x][y]:
+                continue
+            self.set_step(x, y, step)
+            for direction in range(8):
+                nx = x + dx[direction]
+                ny = y + dy[direction]
+                if 0 <= nx < self.n and 0 <= ny < self.m and self.M[nx][ny] > self.M[x][y] and (nx, ny) not in queued:
+                    queued.add((nx, ny))
+                    heapq.heappush(heap, (self.M[nx][ny], nx, ny))
+
+    def longest_walk(self):
+        '''
+        output: the same as longest_walk(M) for the current M
+        the first cell in row order with the largest step_len is the smallest cell in the set of the largest step length
+        time complexity: O(C + L) where C is the number of cells with the largest step_len and L is the length of the walk
+        '''
+        maxstep = max(self.cells)
+        nowx, nowy = min(self.cells[maxstep])
+        ans = [(nowx, nowy)]
+        nowstepsize = maxstep
+        while nowstepsize > 1:
+            nowx, nowy = nextxy(self.step_len, nowx, nowy)
+            ans.append((nowx, nowy))
+            nowstepsize = self.step_len[nowx][nowy]
+        return (len(ans), ans[::-1])
+
+
+def time_walk_solver(n=300, edits=100):
+    '''
+    generate a random n*n grid, apply single cell edits and ask for the longest walk after each one
+    return (name, time) for a full recompute (np_longest_walk, or a new WalkSolver without numpy) and for WalkSolver.update
+    the solver is built from the grid before the edits, so both sides replay the same changes
+    '''
+    M = [[random.randint(0, 10 ** 6) for j in range(n)] for i in range(n)]
+    changes = [(random.randrange(n), random.randrange(n), random.randint(0, 10 ** 6)) for _ in range(edits)]
+    # WalkSolver keeps its own copy of M
+    solver = WalkSolver(M)
+    to_return = []
+    start_time = time.time()
+    for i, j, value in changes:
+        M[i][j] = value
+        if np is not None:
+            np_longest_walk(M)
+        else:
+            WalkSolver(M).longest_walk()
+    end_time = time.time()
+    to_return.append(('full', end_time - start_time))
+    start_time = time.time()
+    for i, j, value in changes:
+        solver.update(i, j, value)
+        solver.longest_walk()
+    end_time = time.time()
+    to_return.append(('incremental', end_time - start_time))
+    return to_return
+
     
 def main():
     alist = [ [1, 5, 7, 4, 6, 8, 6, 7, 1],
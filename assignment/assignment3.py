@@ -1,5 +1,20 @@
 # Author: Xinyu Ma
 
+import heapq
+import mmap
+import random
+import struct
+import time
+import tracemalloc
+import threading
+from array import array
+from contextlib import contextmanager
+
+try:
+    from . import instrumentation
+except ImportError:
+    import instrumentation
+
 class Trie(object):
     class TrieNode(object):
         # We need a TrieNode class to build a Trie
@@ -10,6 +25,7 @@ class Trie(object):
             # abprefreq: the number of strings that are prefixed with current string and not equal to current string
             # letter: letters stored in current node
             # father: parent node
+            # topk: the most frequent strings in the subtree as (-strfreq, string), None if the Trie keeps no top-k lists
             # time complexity: O(1)
             # space complexity: O(1)
             self.son = [None for _ in range(26)]
@@ -17,6 +33,7 @@ class Trie(object):
             self.abprefreq = 0
             self.letter = None
             self.father = None
+            self.topk = None
 
         def add_node(self, chara):
             # use self node as parent node, if there is no node that stores chara as a child node, add the child node
@@ -35,49 +52,318 @@ class Trie(object):
             # space complexity: O(0)
             return self.son[ord(chara) - 97]
 
+        def copy(self):
+            # return a new node with the same children, counts and letter
+            # used by Trie.add and Trie.remove so that nodes seen by readers are never changed
+            # time complexity: O(1)
+            # space complexity: O(1)
+            node = Trie.TrieNode()
+            node.son = list(self.son)
+            node.strfreq = self.strfreq
+            node.abprefreq = self.abprefreq
+            node.letter = self.letter
+            node.father = self.father
+            node.topk = self.topk
+            return node
+
 
             
     
-    def __init__(self, text): # task1 building a Trie
+    def __init__(self, text, topk_cap=0): # task1 building a Trie
         # initialize a root node without storing any strings
         # build a Trie based on the content of text
+        # abprefreq of every node on the path is increased on the way down, so there is no walk back through father
+        # topk_cap: if > 0, every node keeps its topk_cap most frequent strings for top_k, see build_topk
         # time complexity: O(T)
         # space complexity: O(26^S) S is the length of longest word in text
         self.root = Trie.TrieNode()
-        for word in text:
-            node = self.root
+        # answers of single queries, (root, string_freq answers, prefix_freq answers) or None, see enable_cache
+        self.cache = None
+        self.cache_size = 0
+        # writers of add and remove, see batch
+        self.write_lock = threading.RLock()
+        self.pending = None
+        self.fresh = None
+        self.topk_cap = topk_cap
+        with instrumentation.phase('trie.build'):
+            for word in text:
+                node = self.root
+                for chara in word:
+                    node.abprefreq += 1
+                    node.add_node(chara)
+                    node = node.get_son(chara)
+                node.strfreq += 1
+            if topk_cap > 0:
+                self.build_topk()
+
+    def node_topk(self, node, word):
+        # return the topk list of node from its own strfreq and the topk lists of its children
+        # word: the string of node
+        # time complexity: O(26 * c * log(26 * c)) where c is topk_cap
+        candidates = []
+        if node.strfreq > 0:
+            candidates.append((-node.strfreq, word))
+        for s in node.son:
+            if s != None:
+                candidates += s.topk
+        candidates.sort()
+        return candidates[:self.topk_cap]
+
+    def build_topk(self):
+        # fill the topk list of every node, children before their father (post-order)
+        # the stack holds (node, string of node, whether its children are done)
+        # time complexity: O(N * 26 * c * log(26 * c)) where N is the number of nodes and c is topk_cap
+        stack = [(self.root, '', False)]
+        while stack:
+            node, word, children_done = stack.pop()
+            if children_done:
+                node.topk = self.node_topk(node, word)
+            else:
+                stack.append((node, word, True))
+                for s in node.son:
+                    if s != None:
+                        stack.append((s, word + s.letter, False))
+
+    def update_topk(self, path, word):
+        # recompute the topk lists of the fresh nodes on path after word was added or removed, from the end of word back to the root
+        # path[d] is the node of word[:d], a new list is assigned so snapshots keep their own lists
+        # time complexity: O(w * 26 * c * log(26 * c))
+        if self.topk_cap <= 0:
+            return
+        for depth in range(len(path) - 1, -1, -1):
+            path[depth].topk = self.node_topk(path[depth], word[:depth])
+
+    def top_k(self, prefix, k):
+        # return the k most frequent strings prefixed with prefix as (string, strfreq), most frequent first, ties in alphabetical order
+        # if k <= topk_cap the answer is the start of the topk list of the prefix node: O(len(prefix) + k)
+        # otherwise the subtree is enumerated with iter_wildcard_prefix_freq: O(len(prefix) + S)
+        # k <= 0 gives an empty list
+        if k <= 0:
+            return []
+        node = self.find(prefix)
+        if node == None:
+            return []
+        if self.topk_cap > 0 and k <= self.topk_cap:
+            return [(word, -freq) for freq, word in node.topk[:k]]
+        best = heapq.nsmallest(k, ((-freq, word) for word, freq in self.iter_wildcard_prefix_freq(prefix)))
+        return [(word, -freq) for freq, word in best]
+
+    @contextmanager
+    def batch(self):
+        # apply several add and remove calls as one update:
+        # with trie.batch():
+        #     trie.add('abc')
+        #     trie.remove('ab')
+        # the updates are made on a copy of the changed paths (path copying), nodes reachable from self.root are never changed,
+        # so a reader that has taken self.root keeps seeing a consistent Trie
+        # at the end, the new root is published by one assignment to self.root
+        # fresh holds the nodes created in this batch, only those can be changed in place
+        with self.write_lock:
+            if self.pending is not None:
+                # nested batch, the outer one publishes
+                yield self
+                return
+            self.pending = self.root.copy()
+            self.fresh = {self.pending}
+            try:
+                yield self
+                self.root = self.pending
+                if self.cache is not None:
+                    self.cache = (self.root, {}, {})
+            finally:
+                self.pending = None
+                self.fresh = None
+
+    def writable_son(self, node, chara):
+        # return the child of a fresh node represented by chara as a fresh node, creating or copying it if needed
+        # time complexity: O(1)
+        c = ord(chara) - 97
+        son = node.son[c]
+        if son == None:
+            son = Trie.TrieNode()
+            son.letter = chara
+        elif son not in self.fresh:
+            son = son.copy()
+        else:
+            return son
+        son.father = node
+        node.son[c] = son
+        self.fresh.add(son)
+        return son
+
+    def add(self, word, count=1):
+        # add count copies of word, strfreq and abprefreq are changed along the path of word only
+        # time complexity: O(w) where w is the length of word
+        # space complexity: O(w) for the copied path
+        with self.batch():
+            path = [self.pending]
+            for chara in word:
+                path[-1].abprefreq += count
+                path.append(self.writable_son(path[-1], chara))
+            path[-1].strfreq += count
+            self.update_topk(path, word)
+
+    def remove(self, word, count=1):
+        # remove count copies of word, nodes without any string left in their subtree are cut off
+        # raise ValueError if word appears less than count times
+        # time complexity: O(w) where w is the length of word
+        # space complexity: O(w) for the copied path
+        with self.batch():
+            node = self.pending
             for chara in word:
-                node.add_node(chara)
                 node = node.get_son(chara)
-            node.strfreq += 1
-            while node != self.root:
-                node = node.father
-                node.abprefreq += 1
+                if node == None:
+                    break
+            if node == None or node.strfreq < count:
+                raise ValueError('%r appears less than %d times' % (word, count))
+            path = [self.pending]
+            for chara in word:
+                path[-1].abprefreq -= count
+                path.append(self.writable_son(path[-1], chara))
+            path[-1].strfreq -= count
+            # prune empty nodes from the end of the path
+            for depth in range(len(word), 0, -1):
+                node = path[depth]
+                if node.strfreq + node.abprefreq > 0:
+                    break
+                path[depth - 1].son[ord(word[depth - 1]) - 97] = None
+                del path[depth]
+            self.update_topk(path, word)
+
+    def snapshot(self):
+        # return a read-only Trie of the current version, later add and remove calls do not change it
+        # time complexity: O(1)
+        trie = Trie((), self.topk_cap)
+        trie.root = self.root
+        return trie
+
+    def save(self, path):
+        # write a binary snapshot of the Trie, see ArrayTrie.save for the format
+        # time complexity: O(N) where N is the number of nodes
+        ArrayTrie.from_trie(self).save(path)
+
+    @staticmethod
+    def load(path):
+        # memory-map a snapshot written by save and return it as a read-only ArrayTrie
+        # it answers string_freq, prefix_freq and wildcard_prefix_freq directly from the mapped pages
+        # time complexity: O(1)
+        return ArrayTrie.load(path)
 
 
     def string_freq(self, query_str): # task2
         # reach the node corresponding to query_str and return the corresponding strfreq
+        # if the cache is enabled, a cached answer is returned without walking the Trie
+        # self.root and self.cache are read once, the cache is only used if it belongs to that root, see enable_cache
         # time complexity: O(q)
         # space complexity: O(1)
+        # the walk is written out here instead of calling find, it is the whole cost of a query without the cache
         node = self.root
+        cache = self.cache
+        answers = cache[1] if cache is not None and cache[0] is node else None
+        if answers is not None:
+            freq = answers.get(query_str)
+            if freq is not None:
+                return freq
         for chara in query_str:
-            node = node.get_son(chara)
+            node = node.son[ord(chara) - 97]
             if node == None:
-                return 0
-        return node.strfreq
-        pass
+                freq = 0
+                break
+        else:
+            freq = node.strfreq
+        if answers is not None:
+            if len(answers) >= self.cache_size:
+                answers.clear()
+            answers[query_str] = freq
+        return freq
 
     def prefix_freq(self, query_str): # task3
         # reach the node corresponding to query_str and return the sum of strfreq and abprefreq
+        # if the cache is enabled, a cached answer is returned without walking the Trie
+        # self.root and self.cache are read once, the cache is only used if it belongs to that root, see enable_cache
         # time complexity: O(q)
         # space complexity: O(1)
+        # the walk is written out here instead of calling find, it is the whole cost of a query without the cache
         node = self.root
+        cache = self.cache
+        answers = cache[2] if cache is not None and cache[0] is node else None
+        if answers is not None:
+            freq = answers.get(query_str)
+            if freq is not None:
+                return freq
         for chara in query_str:
-            node = node.get_son(chara)
+            node = node.son[ord(chara) - 97]
             if node == None:
-                return 0
-        return node.abprefreq + node.strfreq
-        pass
+                freq = 0
+                break
+        else:
+            freq = node.abprefreq + node.strfreq
+        if answers is not None:
+            if len(answers) >= self.cache_size:
+                answers.clear()
+            answers[query_str] = freq
+        return freq
+
+    def find(self, query_str, root=None):
+        # return the node corresponding to query_str, None if there is none
+        # root: the root to start from, self.root if None
+        # time complexity: O(q)
+        node = self.root if root is None else root
+        for chara in query_str:
+            node = node.son[ord(chara) - 97]
+            if node == None:
+                return None
+        return node
+
+    def enable_cache(self, maxsize=1024):
+        # keep up to maxsize answers each of string_freq and prefix_freq in plain dictionaries keyed by the query
+        # maxsize = 0 turns the cache off
+        # a full dictionary is emptied instead of tracking the least recently used answer, so a hit is one dict lookup,
+        # the frequent queries are back in it right away
+        # the cache is the tuple (root, string_freq answers, prefix_freq answers), batch swaps in a new tuple when it publishes a root,
+        # a reader only uses the tuple of the root it walks, so an answer of an old root never reaches the cache of a new one,
+        # and no lock is needed: readers only get and set single keys of the dictionaries
+        # time complexity: O(1)
+        with self.write_lock:
+            self.cache_size = maxsize
+            self.cache = (self.root, {}, {}) if maxsize > 0 else None
+
+    def find_many(self, queries):
+        # return the node corresponding to each query, None if there is none
+        # repeated queries are walked only once, and the distinct queries are walked in sorted order,
+        # so a query shares its prefix with the one before it
+        # path keeps the nodes of the previous query, the shared prefix is reused and only the rest is walked
+        # time complexity: O(D log D) comparisons for sorting the D distinct queries, plus the letters not shared with the previous query
+        # space complexity: O(Q + s)
+        found = dict.fromkeys(queries)
+        path = [self.root]
+        prev = ''
+        for query in sorted(found):
+            # path[d] is the node of prev[:d], as far as it exists
+            common = 0
+            limit = min(len(query), len(path) - 1)
+            while common < limit and query[common] == prev[common]:
+                common += 1
+            del path[common + 1:]
+            node = path[-1]
+            for chara in query[common:]:
+                node = node.son[ord(chara) - 97]
+                if node == None:
+                    break
+                path.append(node)
+            found[query] = node
+            prev = query
+        return [found[query] for query in queries]
+
+    def string_freq_many(self, queries):
+        # return [string_freq(query) for query in queries], sharing the walk of common prefixes
+        # time complexity: see find_many
+        return [0 if node == None else node.strfreq for node in self.find_many(queries)]
+
+    def prefix_freq_many(self, queries):
+        # return [prefix_freq(query) for query in queries], sharing the walk of common prefixes
+        # time complexity: see find_many
+        return [0 if node == None else node.abprefreq + node.strfreq for node in self.find_many(queries)]
 
     def wildcard_prefix_freq(self, query_str): # task4
         # return all strings that prefixed with query_str
@@ -88,37 +374,341 @@ class Trie(object):
         # when pos = 2, we reach '?', dfs will search all the child nodes of 'a' node, the letters corresponding to all child nodes will be added to the end of matchstr, and the letters at the end will be deleted after the search
         # when pos = 3, we reach an empty string, pos >= qstrlen, if strfreq of current node is > 0, then the current matchstr is constructed into the corresponding numbers of strings and added to the list
         # we will only search the nodes that match query_str, so time complexity is O(q+S)
-        # space complexity: O(s) where s is the length of longest word
-        matchstr = ''
+        # the search itself is done by iter_wildcard_prefix_freq, here each (string, strfreq) is expanded into strfreq copies
+        # space complexity: O(s) where s is the length of longest word, plus the output
         matchlist = []
+        with instrumentation.phase('trie.query'):
+            for matchstr, strfreq in self.iter_wildcard_prefix_freq(query_str):
+                matchlist += [matchstr] * strfreq
+        return matchlist
+
+    def iter_wildcard_prefix_freq(self, query_str):
+        # generator of (string, strfreq) for every string prefixed with query_str, in the order of wildcard_prefix_freq
+        # the dfs keeps (node, pos) on a stack instead of recursing, so long words cannot hit the recursion limit
+        # pos is also the depth of node, so matchstr is a list of letters cut back to pos - 1 before the letter of node is added
+        # children are pushed from 'z' to 'a' so they are visited from 'a' to 'z'
+        # a letter of query_str without a matching child simply ends that branch
+        # the number of nodes popped is reported as trie.wildcard.nodes_visited when instrumentation is enabled
+        # time complexity: O(q+S)
+        # space complexity: O(26 * s) for the stack, nothing is kept for strings already yielded
+        qstrlen = len(query_str)
+        matchstr = []
+        stack = [(self.root, 0)]
+        visited = 0
+        try:
+            while stack:
+                node, pos = stack.pop()
+                visited += 1
+                if pos > 0:
+                    del matchstr[pos - 1:]
+                    matchstr.append(node.letter)
+                if pos >= qstrlen and node.strfreq > 0:
+                    yield ''.join(matchstr), node.strfreq
+                if pos >= qstrlen or query_str[pos] == '?':
+                    for s in reversed(node.son):
+                        if s != None:
+                            stack.append((s, pos + 1))
+                else:
+                    s = node.get_son(query_str[pos])
+                    if s != None:
+                        stack.append((s, pos + 1))
+        finally:
+            # reported once per query, also when the caller stops early
+            instrumentation.count('trie.wildcard.nodes_visited', visited)
+
+    def wildcard_prefix_count(self, query_str):
+        # return len(wildcard_prefix_freq(query_str)) without building any string
+        # the dfs only goes as deep as query_str, a node reached at the end of query_str adds strfreq + abprefreq,
+        # which already counts every string in its subtree
+        # time complexity: O(26^w * q) where w is the number of '?' in query_str, independent of the size of the subtrees
+        # space complexity: O(26 * q)
         qstrlen = len(query_str)
-        pos = 0
-        def dfs(node):
-            nonlocal pos
-            nonlocal matchstr
-            nonlocal matchlist
-            if pos >= qstrlen and node.strfreq > 0:
-                matchlist += ([matchstr]*node.strfreq)
-            if pos >= qstrlen or query_str[pos] == '?':
+        total = 0
+        stack = [(self.root, 0)]
+        while stack:
+            node, pos = stack.pop()
+            if pos >= qstrlen:
+                total += node.strfreq + node.abprefreq
+            elif query_str[pos] == '?':
                 for s in node.son:
                     if s != None:
-                        matchstr += s.letter
-                        pos += 1
-                        dfs(s)
-                        pos -= 1
-                        matchstr = matchstr[:-1]
+                        stack.append((s, pos + 1))
             else:
-                matchstr += query_str[pos]
-                pos += 1
-                dfs(node.get_son(query_str[pos-1]))
-                pos -= 1
-                matchstr = matchstr[:-1]
-        dfs(self.root)
+                s = node.get_son(query_str[pos])
+                if s != None:
+                    stack.append((s, pos + 1))
+        return total
+
+
+class ArrayTrie(object):
+    # A Trie with the same queries as Trie, but the nodes are rows of flat typed arrays instead of TrieNode objects
+    # node 0 is the root, node k has the columns:
+    # son[26 * k + c]: child node of letter chr(97 + c), 0 if there is none (the root is never a child)
+    # father[k]: parent node, letter[k]: letter stored in node k
+    # strfreq[k] and abprefreq[k]: same meaning as in TrieNode
+    # every column is an array of machine integers, so a node takes 26 * 4 + 4 + 1 + 4 + 4 bytes
+
+    def __init__(self, text=()):
+        # build the same Trie as Trie(text)
+        # abprefreq of a node is increased while the word passes through it, so there is no walk back to the root
+        # time complexity: O(T)
+        # space complexity: O(N) where N is the number of nodes
+        self.son = array('i', [0] * 26)
+        self.father = array('i', [0])
+        self.letter = array('b', [0])
+        self.strfreq = array('i', [0])
+        self.abprefreq = array('i', [0])
+        self.words = 0
+        for word in text:
+            node = 0
+            for chara in word:
+                self.abprefreq[node] += 1
+                node = self.add_node(node, chara)
+            self.strfreq[node] += 1
+            self.words += 1
+
+    @staticmethod
+    def from_trie(trie):
+        # copy a Trie into an ArrayTrie, children are numbered in depth first order from 'a' to 'z'
+        # time complexity: O(N) where N is the number of nodes
+        array_trie = ArrayTrie()
+        array_trie.strfreq[0] = trie.root.strfreq
+        array_trie.abprefreq[0] = trie.root.abprefreq
+        array_trie.words = trie.root.strfreq + trie.root.abprefreq
+        stack = [(trie.root, 0)]
+        while stack:
+            node, index = stack.pop()
+            for s in node.son:
+                if s != None:
+                    son = array_trie.add_node(index, s.letter)
+                    array_trie.strfreq[son] = s.strfreq
+                    array_trie.abprefreq[son] = s.abprefreq
+                    stack.append((s, son))
+        return array_trie
+
+    # snapshot header: magic, number of nodes, number of words
+    SNAPSHOT_HEADER = struct.Struct('<4sqq')
+    SNAPSHOT_MAGIC = b'TRIE'
+
+    def save(self, path):
+        # write the columns to path after the header, in the order son, father, strfreq, abprefreq, letter
+        # the columns are written in native byte order so load can map them without conversion
+        # time complexity: O(N) where N is the number of nodes
+        with open(path, 'wb') as file:
+            file.write(ArrayTrie.SNAPSHOT_HEADER.pack(ArrayTrie.SNAPSHOT_MAGIC, self.node_count(), self.words))
+            for column in (self.son, self.father, self.strfreq, self.abprefreq, self.letter):
+                file.write(bytes(column))
+
+    @staticmethod
+    def load(path):
+        # memory-map a snapshot written by save, the columns become read-only memoryviews of the mapped file
+        # nothing is parsed or copied, so many processes loading the same file share its pages
+        # the loaded ArrayTrie can be queried but not extended
+        # time complexity: O(1)
+        with open(path, 'rb') as file:
+            buf = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, nodes, words = ArrayTrie.SNAPSHOT_HEADER.unpack_from(buf, 0)
+        if magic != ArrayTrie.SNAPSHOT_MAGIC:
+            raise ValueError('%s is not a Trie snapshot' % path)
+        view = memoryview(buf)
+        array_trie = ArrayTrie.__new__(ArrayTrie)
+        pos = ArrayTrie.SNAPSHOT_HEADER.size
+        for name, typecode, length in (('son', 'i', 26 * nodes), ('father', 'i', nodes), ('strfreq', 'i', nodes),
+                                       ('abprefreq', 'i', nodes), ('letter', 'b', nodes)):
+            size = array(typecode).itemsize * length
+            setattr(array_trie, name, view[pos:pos + size].cast(typecode))
+            pos += size
+        array_trie.words = words
+        array_trie.mapped = buf
+        return array_trie
+
+    def node_count(self):
+        # number of nodes including the root
+        return len(self.father)
+
+    def add_node(self, node, chara):
+        # return the child of node that stores chara, create it if it does not exist
+        # time complexity: O(1) amortized
+        c = ord(chara) - 97
+        son = self.son[26 * node + c]
+        if son == 0:
+            son = len(self.father)
+            self.son[26 * node + c] = son
+            self.son.extend([0] * 26)
+            self.father.append(node)
+            self.letter.append(ord(chara))
+            self.strfreq.append(0)
+            self.abprefreq.append(0)
+        return son
+
+    def get_son(self, node, chara):
+        # return the child node of node represented by chara, 0 if there is none
+        # time complexity: O(1)
+        return self.son[26 * node + ord(chara) - 97]
+
+    def find(self, query_str):
+        # return the node corresponding to query_str, 0 if there is none
+        # (the root is only returned for the empty string)
+        # time complexity: O(q)
+        node = 0
+        for chara in query_str:
+            node = self.son[26 * node + ord(chara) - 97]
+            if node == 0:
+                return 0
+        return node
+
+    def string_freq(self, query_str):
+        # same as Trie.string_freq
+        # time complexity: O(q)
+        node = self.find(query_str)
+        if node == 0 and query_str != '':
+            return 0
+        return self.strfreq[node]
+
+    def prefix_freq(self, query_str):
+        # same as Trie.prefix_freq
+        # time complexity: O(q)
+        node = self.find(query_str)
+        if node == 0 and query_str != '':
+            return 0
+        return self.abprefreq[node] + self.strfreq[node]
+
+    def wildcard_prefix_freq(self, query_str):
+        # same list as Trie.wildcard_prefix_freq, in the same order
+        # time complexity: O(q+S)
+        # space complexity: O(s), plus the output
+        matchlist = []
+        with instrumentation.phase('trie.query'):
+            for matchstr, strfreq in self.iter_wildcard_prefix_freq(query_str):
+                matchlist += [matchstr] * strfreq
         return matchlist
 
+    def iter_wildcard_prefix_freq(self, query_str):
+        # same generator as Trie.iter_wildcard_prefix_freq
+        # the depth first search keeps (node, pos) on a stack instead of recursing,
+        # and children are pushed from 'z' to 'a' so they are visited from 'a' to 'z'
+        # time complexity: O(q+S)
+        # space complexity: O(26 * s) for the stack
+        qstrlen = len(query_str)
+        matchstr = []
+        stack = [(0, 0)]
+        visited = 0
+        try:
+            while stack:
+                node, pos = stack.pop()
+                visited += 1
+                if pos > 0:
+                    del matchstr[pos - 1:]
+                    matchstr.append(chr(self.letter[node]))
+                if pos >= qstrlen and self.strfreq[node] > 0:
+                    yield ''.join(matchstr), self.strfreq[node]
+                if pos >= qstrlen or query_str[pos] == '?':
+                    base = 26 * node
+                    for c in range(25, -1, -1):
+                        son = self.son[base + c]
+                        if son != 0:
+                            stack.append((son, pos + 1))
+                else:
+                    son = self.get_son(node, query_str[pos])
+                    if son != 0:
+                        stack.append((son, pos + 1))
+        finally:
+            # reported once per query, also when the caller stops early
+            instrumentation.count('trie.wildcard.nodes_visited', visited)
+
+    def wildcard_prefix_count(self, query_str):
+        # same as Trie.wildcard_prefix_count
+        # time complexity: O(26^w * q) where w is the number of '?' in query_str
+        # space complexity: O(26 * q)
+        qstrlen = len(query_str)
+        total = 0
+        stack = [(0, 0)]
+        while stack:
+            node, pos = stack.pop()
+            if pos >= qstrlen:
+                total += self.strfreq[node] + self.abprefreq[node]
+            elif query_str[pos] == '?':
+                base = 26 * node
+                for c in range(26):
+                    son = self.son[base + c]
+                    if son != 0:
+                        stack.append((son, pos + 1))
+            else:
+                son = self.get_son(node, query_str[pos])
+                if son != 0:
+                    stack.append((son, pos + 1))
+        return total
+
+    def word(self, node):
+        # return the string stored on the path from the root to node
+        # time complexity: O(s)
+        letters = []
+        while node != 0:
+            letters.append(chr(self.letter[node]))
+            node = self.father[node]
+        return ''.join(reversed(letters))
+
+    def nbytes(self):
+        # bytes used by the columns
+        return sum(column.itemsize * len(column) for column in (self.son, self.father, self.letter, self.strfreq, self.abprefreq))
+
+    def bytes_per_word(self):
+        # bytes used by the columns for each word of text
+        return self.nbytes() / max(self.words, 1)
+
+
+def time_trie(text, queries):
+    # build Trie and ArrayTrie from text, run prefix_freq for every query
+    # return (name, build time, query time, bytes per word) for both, bytes are measured by tracemalloc
+    to_return = []
+    for name, trie_class in (('Trie', Trie), ('ArrayTrie', ArrayTrie)):
+        tracemalloc.start()
+        start_time = time.time()
+        trie = trie_class(text)
+        end_time = time.time()
+        used, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        build_time = end_time - start_time
+        start_time = time.time()
+        for query in queries:
+            trie.prefix_freq(query)
+        end_time = time.time()
+        to_return.append((name, build_time, end_time - start_time, used / max(len(text), 1)))
+    return to_return
+
+
+def time_trie_batch(text, queries, cache_size=1024):
+    # run prefix_freq for every query one at a time, with prefix_freq_many, and one at a time with the cache enabled
+    # return (name, time) for the three ways
+    trie = Trie(text)
+    to_return = []
+    start_time = time.time()
+    for query in queries:
+        trie.prefix_freq(query)
+    end_time = time.time()
+    to_return.append(('single', end_time - start_time))
+    start_time = time.time()
+    trie.prefix_freq_many(queries)
+    end_time = time.time()
+    to_return.append(('many', end_time - start_time))
+    trie.enable_cache(cache_size)
+    start_time = time.time()
+    for query in queries:
+        trie.prefix_freq(query)
+    end_time = time.time()
+    to_return.append(('cached', end_time - start_time))
+    return to_return
+
 
+def zipf_queries(words, n, s=1.1):
+    # n queries drawn from words, the k-th word is drawn with weight 1 / k^s
+    weights = [1 / (k + 1) ** s for k in range(len(words))]
+    return random.choices(words, weights=weights, k=n)
 
 
+def random_text(words, max_len=10, letters='abcdefghijklmnopqrstuvwxyz'):
+    # random lower case words for time_trie
+    return [''.join(random.choice(letters) for _ in range(random.randint(1, max_len))) for _ in range(words)]
 
 
 def main():
@@ -1,5 +1,30 @@
 # Author: Xinyu Ma
 
+import heapq
+import multiprocessing
+import os
+import random
+import struct
+import time
+from collections import OrderedDict
+from multiprocessing import shared_memory
+
+try:
+    from . import instrumentation
+except ImportError:
+    import instrumentation
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# header of the binary CSR cache: magic, number of vertices, number of entries in indices,
+# size and modification time (ns) of the edge file it was built from, -1 if unknown
+CSR_HEADER = struct.Struct('<4sqqqq')
+CSR_MAGIC = b'CSR2'
+
+
 class Graph(object):
     """We use adjacent matrix to represent a Graph"""
     def __init__(self, gfile):
@@ -8,45 +33,263 @@ class Graph(object):
         time complexity: O(V^2) where V is the sum of vertices
         space complexity: O(V^2) where V is the sum of vertices
         '''
+        # CSR storage, only used by graphs from load_csr
+        self.indptr = self.indices = self.weights = None
+        self.bfs_runs = 0
+        # ErrandOracle of recent (ice_locs, ice_cream_locs), see errand_oracle
+        self.oracles = OrderedDict()
+        self.oracle_cache_size = 8
+        # only the original graph is stored, shortest_errand computes its layers on the fly
         with open(gfile) as file:
             self.V = int(file.readline())
-            self.adjaTable = [[(i,0)] for i in range(3 * self.V)]
+            self.adjaTable = [[(i,0)] for i in range(self.V)]
             for line in file.readlines():
                 u, v, w = [int(num) for num in line.split(' ')]
                 self.adjaTable[u].append((v, w))
                 self.adjaTable[v].append((u, w))
-                self.adjaTable[u + self.V].append((v + self.V, w))
-                self.adjaTable[v + self.V].append((u + self.V, w))
-                self.adjaTable[u + 2 * self.V].append((v + 2 * self.V, w))
-                self.adjaTable[v + 2 * self.V].append((u + 2 * self.V, w))
             
-    def shallowest_spanning_tree(self):
+    @staticmethod
+    def load_csr(gfile, cache_path=None):
+        '''
+        load the Graph into compressed sparse row (CSR) arrays instead of adjaTable
+        gfile: the input file containing the Graph, the same format as for Graph(gfile)
+        cache_path: binary cache of the CSR arrays, it is memory-mapped if it exists and was built from gfile as it is now
+        (same size and modification time), otherwise gfile is parsed and the cache is written again
+        the neighbours of u are indices[indptr[u]:indptr[u+1]] with weights[indptr[u]:indptr[u+1]],
+        in the same order as they are appended to adjaTable[u] by Graph(gfile)
+        implementation:
+        the numbers of the file are parsed by NumPy in one call, every edge gives the entries u -> v and v -> u,
+        a stable sort by source vertex puts them in CSR order, indptr is the prefix sum of the out degrees
+        time complexity: O(E log E) for parsing, O(1) for a cached graph
+        space complexity: O(V + E), a single copy of the graph
+        '''
+        if np is None:
+            raise ImportError('load_csr needs numpy')
+        source = file_stamp(gfile)
+        if cache_path is not None and os.path.exists(cache_path) and csr_cache_source(cache_path) == source:
+            return Graph.from_csr(*read_csr_cache(cache_path))
+        with open(gfile, 'rb') as file:
+            V = int(file.readline())
+            numbers = np.fromstring(file.read(), dtype=np.int64, sep=' ')
+        graph = Graph.from_edges(V, numbers[0::3], numbers[1::3], numbers[2::3])
+        if cache_path is not None:
+            graph.save_csr(cache_path, source)
+        return graph
+
+    @staticmethod
+    def from_edges(V, u, v, w):
+        '''
+        make a CSR Graph from arrays of edges (u[i], v[i]) with weights w[i]
+        entry 2i is u -> v of edge i and entry 2i+1 is v -> u, like the appends of Graph(gfile)
+        '''
+        src = np.stack([u, v], axis=1).ravel()
+        dst = np.stack([v, u], axis=1).ravel()
+        weight = np.repeat(w, 2)
+        order = np.argsort(src, kind='stable')
+        indptr = np.zeros(V + 1, dtype=np.int64)
+        np.cumsum(np.bincount(src, minlength=V), out=indptr[1:])
+        return Graph.from_csr(V, indptr, dst[order], weight[order])
+
+    @staticmethod
+    def from_csr(V, indptr, indices, weights):
+        '''
+        make a Graph that runs its algorithms on CSR arrays
+        '''
+        graph = Graph.__new__(Graph)
+        graph.V = V
+        graph.indptr = indptr
+        graph.indices = indices
+        graph.weights = weights
+        graph.adjaTable = None
+        graph.bfs_runs = 0
+        graph.oracles = OrderedDict()
+        graph.oracle_cache_size = 8
+        return graph
+
+    def save_csr(self, path, source=(-1, -1)):
+        '''
+        write the CSR arrays after CSR_HEADER as little-endian int64, in the order indptr, indices, weights
+        source: (size, modification time) of the edge file, see file_stamp, load_csr only uses a cache whose source matches
+        the file is written next to path and then renamed, so a graph still memory-mapping an old cache at path keeps its data
+        '''
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as file:
+            file.write(CSR_HEADER.pack(CSR_MAGIC, self.V, len(self.indices), *source))
+            for column in (self.indptr, self.indices, self.weights):
+                file.write(np.ascontiguousarray(column, dtype='<i8').tobytes())
+        os.replace(tmp_path, path)
+
+    def neighbours(self, u):
+        '''
+        the (v, w) pairs of the edges of vertex u of the original graph, from the CSR arrays or from adjaTable
+        time complexity: O(degree of u)
+        '''
+        if self.indptr is None:
+            return self.adjaTable[u]
+        start, end = int(self.indptr[u]), int(self.indptr[u + 1])
+        return zip(self.indices[start:end].tolist(), self.weights[start:end].tolist())
+
+    def layer_neighbours(self, node, ice_set, ice_cream_set):
+        '''
+        the (next node, w) pairs of node in the three layer graph of shortest_errand, computed from the original graph
+        node = layer * V + vertex, inside a layer the edges are the edges of vertex,
+        between layers there are edges of weight 0 at the vertices in ice_set (layer 0 and 1) and ice_cream_set (layer 1 and 2)
+        time complexity: O(degree of vertex)
+        '''
+        layer, vertex = divmod(node, self.V)
+        offset = layer * self.V
+        for u, w in self.neighbours(vertex):
+            yield u + offset, w
+        if layer == 0:
+            if vertex in ice_set:
+                yield vertex + self.V, 0
+        elif layer == 1:
+            if vertex in ice_set:
+                yield vertex, 0
+            if vertex in ice_cream_set:
+                yield vertex + 2 * self.V, 0
+        elif vertex in ice_cream_set:
+            yield vertex + self.V, 0
+
+    def bfs(self, node):
+        '''
+        BFS from node, return dis, the number of edges from node to every vertex (-1 if it cannot be reached)
+        every call adds one to bfs_runs
+        time complexity: O(V + E)
+        '''
+        self.bfs_runs += 1
+        instrumentation.count('graph.bfs_runs')
+        dis = [-1 for _ in range(self.V)]
+        dis[node] = 0
+        searchlist = [node]
+        nowpos = 0
+        while nowpos < len(searchlist):
+            nodeToSearch = searchlist[nowpos]
+            for nextnode, _ in self.neighbours(nodeToSearch):
+                if dis[nextnode] == -1:
+                    searchlist.append(nextnode)
+                    dis[nextnode] = dis[nodeToSearch] + 1
+            nowpos+=1
+        return dis
+
+    def shallowest_spanning_tree(self, bounded=False):
         '''
         BFS on each node
+        bounded=True finds the same answer with shallowest_spanning_tree_bounded
         time complexity: O(V*(V + E)) < O(V^3)
         '''
+        if bounded:
+            return self.shallowest_spanning_tree_bounded()
+        self.bfs_runs = 0
         mindis = -1
         minnod = -1
         for node in range(self.V):
-            dis = [-1 for _ in range(self.V)]
-            dis[node] = 0
-            searchlist = [node]
-            nowpos = 0
-            while nowpos < len(searchlist):
-                nodeToSearch = searchlist[nowpos]
-                for nextnode, _ in self.adjaTable[nodeToSearch]:
-                    if dis[nextnode] == -1:
-                        searchlist.append(nextnode)
-                        dis[nextnode] = dis[nodeToSearch] + 1
-                nowpos+=1
-            maxdis = max(dis)
+            maxdis = max(self.bfs(node))
             if mindis == -1 or maxdis < mindis:
                 mindis = maxdis
                 minnod = node
         return minnod, mindis
 
+    def shallowest_spanning_tree_bounded(self):
+        '''
+        the same (root, depth) as shallowest_spanning_tree, the first vertex with the smallest eccentricity,
+        without a BFS from every vertex
+        implementation:
+        for every vertex we keep bounds lower[w] <= ecc(w) <= upper[w]
+        after a BFS from v with ecc(v) = e, for every vertex w at distance d:
+        ecc(w) >= max(d, e - d) and ecc(w) <= e + d (triangle inequality)
+        best is the first vertex found with the smallest eccentricity so far, radius its eccentricity
+        a vertex can only change the answer if lower[w] < radius, or lower[w] == radius and w comes before best,
+        all other vertices are dropped from the candidates without a BFS of their own,
+        and a vertex whose bounds meet has a known eccentricity without a BFS too
+        the next BFS source alternates between the candidate with the smallest lower bound (likely a center)
+        and the one with the largest upper bound (likely on the border, which raises the lower bounds of the others)
+        bfs_runs tells how many BFS were needed, on real graphs it is usually a handful
+        the bounds need a connected graph, otherwise the full search is used
+        time complexity: O(K*(V + E)) where K is bfs_runs, O(V*(V + E)) in the worst case
+        '''
+        self.bfs_runs = 0
+        lower = [0 for _ in range(self.V)]
+        upper = [float('inf') for _ in range(self.V)]
+        candidates = set(range(self.V))
+        radius = float('inf')
+        best = -1
+        turn = 0
+        while candidates:
+            if turn % 2 == 0:
+                node = min(candidates, key=lambda w: (lower[w], w))
+            else:
+                node = max(candidates, key=lambda w: (upper[w], -w))
+            turn += 1
+            dis = self.bfs(node)
+            ecc = max(dis)
+            if min(dis) == -1:
+                return self.shallowest_spanning_tree()
+            for w in range(self.V):
+                d = dis[w]
+                lower[w] = max(lower[w], d, ecc - d)
+                upper[w] = min(upper[w], ecc + d)
+            lower[node] = upper[node] = ecc
+            for w in list(candidates):
+                if lower[w] == upper[w]:
+                    # eccentricity of w is known
+                    candidates.discard(w)
+                    if lower[w] < radius or (lower[w] == radius and w < best):
+                        radius = lower[w]
+                        best = w
+            for w in list(candidates):
+                if lower[w] > radius or (lower[w] == radius and w > best):
+                    candidates.discard(w)
+        return best, radius
+
+
+    def csr_arrays(self):
+        '''
+        indptr and indices of the original graph as NumPy arrays, built from adjaTable if the Graph is not CSR
+        time complexity: O(V + E)
+        '''
+        if self.indptr is not None:
+            return np.asarray(self.indptr), np.asarray(self.indices)
+        indptr = np.zeros(self.V + 1, dtype=np.int64)
+        np.cumsum([len(self.adjaTable[u]) for u in range(self.V)], out=indptr[1:])
+        indices = np.fromiter((v for u in range(self.V) for v, _ in self.adjaTable[u]), dtype=np.int64, count=int(indptr[-1]))
+        return indptr, indices
+
+    def shallowest_spanning_tree_bitset(self, workers=None, words=1):
+        '''
+        the same (root, depth) as shallowest_spanning_tree, together with the eccentricity of every vertex
+        implementation:
+        the BFS are run 64 * words sources at a time by bitset_eccentricities,
+        the batches of sources are spread over a process pool of workers processes (in this process if workers is None or 1),
+        indptr and indices are copied once into shared memory and every worker maps them read-only
+        output: (root, depth, ecc) where ecc is an array of the eccentricities
+        time complexity: O(V/(64*words) * D * (V + E) / workers) array work, where D is the depth of the BFS
+        '''
+        indptr, indices = self.csr_arrays()
+        batch = 64 * words
+        tasks = [(start, min(batch, self.V - start), words) for start in range(0, self.V, batch)]
+        if workers is None or workers <= 1:
+            parts = [bitset_eccentricities(indptr, indices, *task) for task in tasks]
+        else:
+            blocks = []
+            try:
+                info = []
+                for column in (indptr, indices):
+                    shm = shared_memory.SharedMemory(create=True, size=max(column.nbytes, 1))
+                    blocks.append(shm)
+                    np.ndarray(column.shape, dtype=np.int64, buffer=shm.buf)[:] = column
+                    info.append((shm.name, column.shape))
+                with multiprocessing.Pool(workers, initializer=open_shared_csr, initargs=tuple(info)) as pool:
+                    parts = pool.map(shared_bitset_eccentricities, tasks)
+            finally:
+                for shm in blocks:
+                    shm.close()
+                    shm.unlink()
+        ecc = np.concatenate(parts) if parts else np.zeros(0, dtype=np.int64)
+        root = int(np.argmin(ecc))
+        return root, int(ecc[root]), ecc
 
-    def shortest_errand(self, home, destination, ice_locs, ice_cream_locs):
+    def shortest_errand(self, home, destination, ice_locs, ice_cream_locs, bidirectional=False):
         '''
         imaging the original graph becomes three layers, each layer is the same as the original graph
         in 1st layer, only ice_locs nodes can lead to 2nd layer
@@ -54,16 +297,217 @@ class Graph(object):
         the number of the node on the upper layer is the number of the node on the next layer + V,
         so the problem becomes the shortest path from home to destination + 2V
         we can find the shortest path by using dijkstra directly
-        time complexity: O((3E+2V)log(3V)) = O(Elog(V))
+        the layers are not stored, layer_neighbours computes the edges of a node from the original graph,
+        and the paths between layers from set membership, so the Graph is not changed by a query
+        dijkstra only pushes the nodes it discovers and stops as soon as destination + 2V is settled,
+        bidirectional=True runs bidirectional_dijkstra instead
+        output: (length, path of vertices), (inf, []) if destination cannot be reached
+        time complexity: O((3E+2V)log(3V)) = O(Elog(V)) in the worst case, only the part of the graph closer than the answer is searched
+        '''
+        ice_set = set(ice_locs)
+        ice_cream_set = set(ice_cream_locs)
+        target = destination + 2 * self.V
+        with instrumentation.phase('errand.search'):
+            if bidirectional:
+                dis, nodes = self.bidirectional_dijkstra(home, target, ice_set, ice_cream_set)
+            else:
+                dis, nodes = self.dijkstra(home, target, ice_set, ice_cream_set)
+        # organize the path, moving between layers stays on the same vertex
+        path = []
+        for node in nodes:
+            if len(path) == 0 or path[-1] != node % self.V:
+                path.append(node % self.V)
+        return dis, path
+
+    def dijkstra(self, source, target, ice_set, ice_cream_set):
+        '''
+        dijkstra on the three layer graph with a lazy binary heap (heapq):
+        a node is pushed again when its distance gets smaller, an entry larger than the current distance is skipped when popped,
+        so there is no position map and no decrease key, and dist and pred are dictionaries of the discovered nodes only
+        a push of a node that is already in dist is what an indexed heap would do as a decrease key, it is counted as one
+        output: (distance, list of nodes from source to target), (inf, []) if target cannot be reached
+        time complexity: O(E'log(E')) where E' is the number of edges looked at before target is settled
+        '''
+        dist = {source: 0}
+        pred = {source: -1}
+        heap = [(0, source)]
+        pushes = 1
+        pops = 0
+        decrease_keys = 0
+        settled = 0
+        try:
+            while heap:
+                dis, v = heapq.heappop(heap)
+                pops += 1
+                if dis > dist[v]:
+                    continue
+                settled += 1
+                if v == target:
+                    return dis, pred_path(pred, target)
+                for u, w in self.layer_neighbours(v, ice_set, ice_cream_set):
+                    if u not in dist:
+                        pushes += 1
+                    elif dis + w < dist[u]:
+                        pushes += 1
+                        decrease_keys += 1
+                    else:
+                        continue
+                    dist[u] = dis + w
+                    pred[u] = v
+                    heapq.heappush(heap, (dis + w, u))
+            return float('inf'), []
+        finally:
+            count_heap('errand', pushes, pops, decrease_keys, settled)
+
+    def bidirectional_dijkstra(self, source, target, ice_set, ice_cream_set):
+        '''
+        dijkstra from source and from target at the same time, the side with the smaller heap top is expanded
+        every edge of the three layer graph goes both ways, so the backward search uses layer_neighbours too
+        best is the shortest path seen through a node reached from both sides,
+        once the two heap tops add up to at least best, no shorter path is left
+        output: (distance, list of nodes from source to target), (inf, []) if target cannot be reached
+        time complexity: O(E'log(E')), usually E' is much smaller than for dijkstra on large graphs
+        '''
+        dist = ({source: 0}, {target: 0})
+        pred = ({source: -1}, {target: -1})
+        heaps = ([(0, source)], [(0, target)])
+        best = 0 if source == target else float('inf')
+        meet = source
+        pushes = 2
+        pops = 0
+        decrease_keys = 0
+        settled = 0
+        while heaps[0] and heaps[1] and heaps[0][0][0] + heaps[1][0][0] < best:
+            side = 0 if heaps[0][0][0] <= heaps[1][0][0] else 1
+            dis, v = heapq.heappop(heaps[side])
+            pops += 1
+            if dis > dist[side][v]:
+                continue
+            settled += 1
+            other = dist[1 - side]
+            for u, w in self.layer_neighbours(v, ice_set, ice_cream_set):
+                if u not in dist[side] or dis + w < dist[side][u]:
+                    pushes += 1
+                    if u in dist[side]:
+                        decrease_keys += 1
+                    dist[side][u] = dis + w
+                    pred[side][u] = v
+                    heapq.heappush(heaps[side], (dis + w, u))
+                    if u in other and dis + w + other[u] < best:
+                        best = dis + w + other[u]
+                        meet = u
+        count_heap('errand', pushes, pops, decrease_keys, settled)
+        if best == float('inf'):
+            return best, []
+        return best, pred_path(pred[0], meet) + pred_path(pred[1], meet)[::-1][1:]
+
+    def shortest_route(self, home, destination, stop_sets, ordered=True):
+        '''
+        shortest walk from home to destination that visits one location of every set in stop_sets
+        ordered=True: the sets are visited in the given order, like shortest_errand with k = len(stop_sets) categories
+        ordered=False: the sets can be visited in any order
+        implementation:
+        a node is state * V + vertex, the graph of nodes is never stored, route_neighbours computes the edges of a node,
+        ordered: state is the number of sets done (k + 1 layers), at a vertex of stop_sets[state] the state goes up by 1 at cost 0
+        unordered: state is a bitmask of the sets done (2^k layers), at a vertex the bits of all its sets can be added at cost 0
+        member[v] is the bitmask of the sets containing v, only stored for stop locations
+        the search is dijkstra with dist and pred only for discovered nodes, it stops when (destination, all sets done) is settled
+        output: (length, path of vertices), (inf, []) if there is no such walk
+        time complexity: O(S*E log(S*V)) in the worst case, S = k + 1 or 2^k, usually much less is searched
+        space complexity: O(V + E) for the graph plus the discovered nodes
         '''
-        # create path between two layers
-        for node in ice_locs:
-            self.adjaTable[node].append((node + self.V, 0))
-            self.adjaTable[node + self.V].append((node, 0))
-        for node in ice_cream_locs:
-            self.adjaTable[node + 2 * self.V].append((node + self.V, 0))
-            self.adjaTable[node + self.V].append((node + 2 * self.V, 0))
+        member = {}
+        for j, stops in enumerate(stop_sets):
+            for v in stops:
+                member[v] = member.get(v, 0) | (1 << j)
+        k = len(stop_sets)
+        done = k if ordered else (1 << k) - 1
+        source = self.route_state(home, 0, member, ordered) * self.V + home
+        target = done * self.V + destination
+        dist = {source: 0}
+        pred = {source: -1}
+        heap = [(0, source)]
+        while heap:
+            dis, node = heapq.heappop(heap)
+            if dis > dist[node]:
+                continue
+            if node == target:
+                path = []
+                for node in pred_path(pred, target):
+                    if len(path) == 0 or path[-1] != node % self.V:
+                        path.append(node % self.V)
+                return dis, path
+            state = node // self.V
+            for v, w in self.neighbours(node % self.V):
+                u = self.route_state(v, state, member, ordered) * self.V + v
+                if u not in dist or dis + w < dist[u]:
+                    dist[u] = dis + w
+                    pred[u] = node
+                    heapq.heappush(heap, (dis + w, u))
+        return float('inf'), []
+
+    def route_state(self, vertex, state, member, ordered):
+        '''
+        the state after arriving at vertex, taking every stop at vertex that can be taken (the moves of cost 0)
+        taking a stop as soon as it is reached is never worse, so these moves are folded into the edges
+        ordered: state goes up while vertex is in the next set, unordered: the bits of vertex are added to the mask
+        time complexity: O(k)
+        '''
+        bits = member.get(vertex, 0)
+        if not ordered:
+            return state | bits
+        while bits >> state & 1:
+            state += 1
+        return state
+
+    def base_dijkstra(self, sources):
+        '''
+        dijkstra on the original graph from several sources at once
+        sources: dictionary from vertex to its starting distance
+        output: (dist, pred) lists over all vertices, pred is -1 at a source, dist is inf where nothing can be reached
+        time complexity: O(E log(V))
+        '''
+        dist = [float('inf') for _ in range(self.V)]
+        pred = [-1 for _ in range(self.V)]
+        heap = []
+        for v, dis in sources.items():
+            if dis < dist[v]:
+                dist[v] = dis
+                heap.append((dis, v))
+        heapq.heapify(heap)
+        while heap:
+            dis, v = heapq.heappop(heap)
+            if dis > dist[v]:
+                continue
+            for u, w in self.neighbours(v):
+                if dis + w < dist[u]:
+                    dist[u] = dis + w
+                    pred[u] = v
+                    heapq.heappush(heap, (dis + w, u))
+        return dist, pred
+
+    def errand_oracle(self, ice_locs, ice_cream_locs):
+        '''
+        the ErrandOracle of (ice_locs, ice_cream_locs), built on first use and kept in a least recently used cache
+        of oracle_cache_size oracles, keyed by the two location sets
+        '''
+        key = (frozenset(ice_locs), frozenset(ice_cream_locs))
+        if key in self.oracles:
+            self.oracles.move_to_end(key)
+            return self.oracles[key]
+        oracle = ErrandOracle(self, ice_locs, ice_cream_locs)
+        self.oracles[key] = oracle
+        if len(self.oracles) > self.oracle_cache_size:
+            self.oracles.popitem(last=False)
+        return oracle
 
+    def shortest_errand_indexed(self, home, destination, ice_locs, ice_cream_locs):
+        '''
+        the previous shortest_errand, dijkstra with an indexed heap of all 3V nodes, kept to compare with in time_shortest_errand
+        time complexity: O((3E+2V)log(3V)) = O(Elog(V))
+        '''
+        ice_set = set(ice_locs)
+        ice_cream_set = set(ice_cream_locs)
         dist = [float('inf') for _ in range(self.V * 3)]
         pred = [-1 for _ in range(self.V * 3)]
         dist[home] = 0
@@ -79,16 +523,16 @@ class Graph(object):
             heap.append([v, num])
             pos = len(heap)-1
             vertices[v] = pos
-            while heap[pos][1] < heap[pos//2][1]:
+            while pos > 0 and heap[pos][1] < heap[(pos-1)//2][1]:
                 temp = vertices[heap[pos][0]]
-                vertices[heap[pos][0]] = vertices[heap[pos//2][0]]
-                vertices[heap[pos//2][0]] = temp
+                vertices[heap[pos][0]] = vertices[heap[(pos-1)//2][0]]
+                vertices[heap[(pos-1)//2][0]] = temp
 
                 temp = heap[pos]
-                heap[pos] = heap[pos//2]
-                heap[pos//2] = temp
+                heap[pos] = heap[(pos-1)//2]
+                heap[(pos-1)//2] = temp
 
-                pos = pos//2
+                pos = (pos-1)//2
 
 
         def pop(heap, vertices):
@@ -130,16 +574,16 @@ class Graph(object):
             if pos == -1:
                 return 
             heap[pos][1] = num
-            while heap[pos][1] < heap[pos//2][1]:
+            while pos > 0 and heap[pos][1] < heap[(pos-1)//2][1]:
                 temp = vertices[heap[pos][0]]
-                vertices[heap[pos][0]] = vertices[heap[pos//2][0]]
-                vertices[heap[pos//2][0]] = temp
+                vertices[heap[pos][0]] = vertices[heap[(pos-1)//2][0]]
+                vertices[heap[(pos-1)//2][0]] = temp
 
                 temp = heap[pos]
-                heap[pos] = heap[pos//2]
-                heap[pos//2] = temp
+                heap[pos] = heap[(pos-1)//2]
+                heap[(pos-1)//2] = temp
 
-                pos = pos//2
+                pos = (pos-1)//2
 
         tlis = [float('inf') for v in range(self.V * 3)]
         # for u, w in self.adjaTable[home]:
@@ -148,15 +592,21 @@ class Graph(object):
         for u in range(self.V * 3):
             push(heap, vertices, tlis[u], u)
             #dist[u] = tlis[u]
+        pops = 0
+        decrease_keys = 0
         while len(heap) > 0:
             v, dis = pop(heap, vertices)
+            pops += 1
             if v == destination+2 * self.V:
                 break
-            for u, w in self.adjaTable[v]:
+            for u, w in self.layer_neighbours(v, ice_set, ice_cream_set):
                 if vertices[u] != -1 and dis + w < heap[vertices[u]][1]:
                     pred[u] = v
                     dist[u] = dis + w
                     reduceTo(heap, vertices, dis + w, u)
+                    decrease_keys += 1
+        # every node is pushed once at the start and every pop settles a node
+        count_heap('errand_indexed', self.V * 3, pops, decrease_keys, pops)
         # organize the path according to pred
         # print(pred)
         path = [destination]
@@ -169,6 +619,265 @@ class Graph(object):
         return dist[destination+2 * self.V], path[::-1]
 
 
+class ErrandOracle(object):
+    '''
+    answers shortest_errand for one pair (ice_locs, ice_cream_locs) and any home and destination by table lookup,
+    with the same length as Graph.shortest_errand and a path of that length
+    an errand is home -> ice location i -> ice cream location c -> destination, so its length is
+    min over i of  d(home, i) + L_i(destination)  where  L_i(t) = min over c of d(i, c) + d(c, t)
+    for every ice location i, two distance fields over all vertices are precomputed:
+    to_ice[i]: d(i, v) by dijkstra from i, the graph is undirected so it is also d(v, i)
+    from_ice[i]: L_i(v) by one dijkstra from all ice cream locations c at once, c starting at d(i, c)
+    the pred lists of both searches are kept to build paths on demand
+    time complexity: O(I * E log(V)) to build, O(I) per query, O(I + path length) with the path
+    space complexity: O(I * V)
+    '''
+    def __init__(self, graph, ice_locs, ice_cream_locs):
+        self.graph = graph
+        self.ice_locs = sorted(set(ice_locs))
+        self.ice_cream_locs = sorted(set(ice_cream_locs))
+        self.to_ice = []
+        self.from_ice = []
+        for i in self.ice_locs:
+            dist, pred = graph.base_dijkstra({i: 0})
+            self.to_ice.append((dist, pred))
+            self.from_ice.append(graph.base_dijkstra({c: dist[c] for c in self.ice_cream_locs}))
+
+    def distance(self, home, destination):
+        '''
+        length of the shortest errand, and the index of its ice location in ice_locs (-1 if there is none)
+        time complexity: O(I)
+        '''
+        best = float('inf')
+        best_index = -1
+        for k in range(len(self.ice_locs)):
+            dis = self.to_ice[k][0][home] + self.from_ice[k][0][destination]
+            if dis < best:
+                best = dis
+                best_index = k
+        return best, best_index
+
+    def shortest_errand(self, home, destination):
+        '''
+        (length, path of vertices) of a shortest errand, the length is the same as Graph.shortest_errand(home, destination, ice_locs, ice_cream_locs)
+        when several shortest errands exist, the path can be a different one of the same length, ties are broken by the order of ice_locs
+        and the pred lists of the precomputed searches, not by the order Graph.shortest_errand settles nodes
+        the path is built from the pred lists: home -> i from to_ice (read backwards from home),
+        destination -> c from from_ice (read backwards from destination), and c -> i from to_ice again
+        time complexity: O(I + path length)
+        '''
+        dis, k = self.distance(home, destination)
+        if k == -1:
+            return dis, []
+        _, pred = self.to_ice[k]
+        _, pred_c = self.from_ice[k]
+        # home -> i
+        nodes = pred_path(pred, home)[::-1]
+        # c -> destination, c is where the chain from destination ends
+        last = pred_path(pred_c, destination)
+        # i -> c
+        nodes += pred_path(pred, last[0])[1:]
+        nodes += last[1:]
+        path = []
+        for node in nodes:
+            if len(path) == 0 or path[-1] != node:
+                path.append(node)
+        return dis, path
+
+
+def bitset_eccentricities(indptr, indices, start, count, words):
+    '''
+    eccentricities of the sources start, start+1, ..., start+count-1 with one BFS for all of them
+    seen[v] and frontier[v] are words of 64 bits, bit b of word k is source start + 64*k + b
+    one level of all the BFS at once: the next frontier of v is the OR of the frontiers of its neighbours, without the bits already in seen[v]
+    the OR over the neighbours is np.bitwise_or.reduceat over frontier[indices], one segment per vertex in CSR order
+    a source whose bit still appears in the new frontier has not finished, so its eccentricity is at least this level
+    time complexity: O(D * (V + E) * words) array work, D is the largest eccentricity of the sources
+    space complexity: O((V + E) * words)
+    '''
+    V = len(indptr) - 1
+    seen = np.zeros((V, words), dtype=np.uint64)
+    for k in range(count):
+        seen[start + k, k // 64] |= np.uint64(1) << np.uint64(k % 64)
+    frontier = seen.copy()
+    ecc = np.zeros(count, dtype=np.int64)
+    # reduceat needs a valid index for every segment, so the gathered frontiers get one extra zero row at the end,
+    # a vertex without edges starts its segment there (or at the next vertex) and is cleared afterwards
+    has_edges = indptr[1:] > indptr[:-1]
+    offsets = indptr[:-1]
+    gathered = np.zeros((len(indices) + 1, words), dtype=np.uint64)
+    bits = np.uint64(1) << np.arange(64, dtype=np.uint64)
+    level = 0
+    while len(indices) > 0:
+        np.take(frontier, indices, axis=0, out=gathered[:-1])
+        reached = np.bitwise_or.reduceat(gathered, offsets, axis=0)
+        reached[~has_edges] = 0
+        frontier = reached & ~seen
+        alive = np.bitwise_or.reduce(frontier, axis=0)
+        if not alive.any():
+            break
+        seen |= frontier
+        level += 1
+        for k in range(words):
+            if alive[k]:
+                found = np.flatnonzero(alive[k] & bits) + 64 * k
+                ecc[found[found < count]] = level
+    return ecc
+
+
+# shared CSR arrays of the worker processes of shallowest_spanning_tree_bitset
+shared_csr = None
+
+
+def open_shared_csr(indptr_info, indices_info):
+    '''
+    initializer of the worker processes, map indptr and indices from shared memory
+    '''
+    global shared_csr
+    blocks = [shared_memory.SharedMemory(name=name) for name, _ in (indptr_info, indices_info)]
+    arrays = [np.ndarray(shape, dtype=np.int64, buffer=shm.buf) for shm, (_, shape) in zip(blocks, (indptr_info, indices_info))]
+    shared_csr = (blocks, arrays)
+
+
+def shared_bitset_eccentricities(task):
+    '''
+    bitset_eccentricities on the shared CSR arrays, task is (start, count, words)
+    '''
+    indptr, indices = shared_csr[1]
+    return bitset_eccentricities(indptr, indices, *task)
+
+
+def count_heap(name, pushes, pops, decrease_keys, settled):
+    '''
+    report the heap operations of one search to instrumentation, once per search so the loops only add to local counters
+    '''
+    if instrumentation.enabled:
+        instrumentation.count(name + '.heap_pushes', pushes)
+        instrumentation.count(name + '.heap_pops', pops)
+        instrumentation.count(name + '.decrease_keys', decrease_keys)
+        instrumentation.count(name + '.settled', settled)
+
+
+def pred_path(pred, node):
+    '''
+    the nodes from the start of a search to node, following pred back until -1
+    '''
+    nodes = []
+    while node != -1:
+        nodes.append(node)
+        node = pred[node]
+    return nodes[::-1]
+
+
+def time_shortest_errand(V=1000000, E=1500000, queries=5, stops=10):
+    '''
+    generate a sparse random graph (a ring plus random edges) and random queries,
+    return (name, time) for shortest_errand_indexed, shortest_errand and shortest_errand with bidirectional=True
+    '''
+    ring = np.arange(V)
+    u = np.concatenate([ring, np.random.randint(0, V, E - V)])
+    v = np.concatenate([(ring + 1) % V, np.random.randint(0, V, E - V)])
+    w = np.random.randint(1, 100, E)
+    graph = Graph.from_edges(V, u, v, w)
+    cases = [(random.randrange(V), random.randrange(V), random.sample(range(V), stops), random.sample(range(V), stops))
+             for _ in range(queries)]
+    to_return = []
+    for name, errand in (('indexed', graph.shortest_errand_indexed),
+                         ('lazy', graph.shortest_errand),
+                         ('bidirectional', lambda *case: graph.shortest_errand(*case, bidirectional=True))):
+        start_time = time.time()
+        for case in cases:
+            errand(*case)
+        end_time = time.time()
+        to_return.append((name, end_time - start_time))
+    return to_return
+
+
+def time_shortest_route(V=20000, E=40000, ks=(1, 2, 4, 6, 8, 10), queries=3, stops=5, max_unordered=6):
+    '''
+    generate a sparse random graph (a ring plus random edges) and for each k random queries with k sets of stops,
+    return (k, time ordered, time unordered)
+    the unordered search has up to 2^k states per vertex, it is only timed for k <= max_unordered (None otherwise)
+    '''
+    ring = np.arange(V)
+    u = np.concatenate([ring, np.random.randint(0, V, E - V)])
+    v = np.concatenate([(ring + 1) % V, np.random.randint(0, V, E - V)])
+    w = np.random.randint(1, 100, E)
+    graph = Graph.from_edges(V, u, v, w)
+    to_return = []
+    for k in ks:
+        cases = [(random.randrange(V), random.randrange(V), [random.sample(range(V), stops) for _ in range(k)])
+                 for _ in range(queries)]
+        times = [None, None]
+        for ordered in (True, False):
+            if not ordered and k > max_unordered:
+                continue
+            start_time = time.time()
+            for home, destination, stop_sets in cases:
+                graph.shortest_route(home, destination, stop_sets, ordered)
+            end_time = time.time()
+            times[0 if ordered else 1] = end_time - start_time
+        to_return.append((k, times[0], times[1]))
+    return to_return
+
+
+def read_csr_cache(path):
+    '''
+    memory-map a cache written by Graph.save_csr, return (V, indptr, indices, weights)
+    the arrays are read-only views of the file, nothing is parsed
+    '''
+    with open(path, 'rb') as file:
+        magic, V, nnz, _, _ = CSR_HEADER.unpack(file.read(CSR_HEADER.size))
+    if magic != CSR_MAGIC:
+        raise ValueError('%s is not a CSR graph cache' % path)
+    offset = CSR_HEADER.size
+    indptr = np.memmap(path, dtype='<i8', mode='r', offset=offset, shape=(V + 1,))
+    offset += 8 * (V + 1)
+    indices = np.memmap(path, dtype='<i8', mode='r', offset=offset, shape=(nnz,))
+    offset += 8 * nnz
+    weights = np.memmap(path, dtype='<i8', mode='r', offset=offset, shape=(nnz,))
+    return V, indptr, indices, weights
+
+
+def file_stamp(path):
+    '''
+    (size, modification time in ns) of a file, stored in a CSR cache to tell whether it still belongs to its edge file
+    '''
+    stat = os.stat(path)
+    return (stat.st_size, stat.st_mtime_ns)
+
+
+def csr_cache_source(path):
+    '''
+    the (size, modification time) stored in a CSR cache, None if path is not a cache of this format
+    '''
+    with open(path, 'rb') as file:
+        header = file.read(CSR_HEADER.size)
+    if len(header) < CSR_HEADER.size:
+        return None
+    magic, _, _, size, mtime = CSR_HEADER.unpack(header)
+    if magic != CSR_MAGIC:
+        return None
+    return (size, mtime)
+
+
+def check_bitset_eccentricities(V=300, E=400, isolated=20, seed=0):
+    '''
+    compare shallowest_spanning_tree_bitset with shallowest_spanning_tree and bfs on a random CSR graph
+    whose last isolated vertices have no edges, and on the smallest such graph
+    raise AssertionError if they differ
+    '''
+    rng = random.Random(seed)
+    u = np.array([rng.randrange(V - isolated) for _ in range(E)], dtype=np.int64)
+    v = np.array([rng.randrange(V - isolated) for _ in range(E)], dtype=np.int64)
+    w = np.ones(E, dtype=np.int64)
+    graphs = [Graph.from_edges(4, np.array([2, 2]), np.array([0, 1]), np.array([1, 1])), Graph.from_edges(V, u, v, w)]
+    for graph in graphs:
+        root, depth, ecc = graph.shallowest_spanning_tree_bitset()
+        assert [int(e) for e in ecc] == [max(graph.bfs(node)) for node in range(graph.V)]
+        assert (root, depth) == graph.shallowest_spanning_tree()
+
+
 def main():
     g = Graph("gfile3.txt")
     root, depth = g.shallowest_spanning_tree() #this runs task 2
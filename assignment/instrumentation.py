@@ -0,0 +1,163 @@
+'''
+Counters and timers shared by assignment1 to assignment4
+
+everything is off until enable() is called, while it is off:
+count, observe and add_time return at once, phase returns a context manager that does nothing,
+and the hot loops of the assignments only check instrumentation.enabled once per call or per pass,
+so the cost of leaving the calls in place is close to nothing
+
+counters: name -> number, e.g. 'radix_sort.passes'
+stats: name -> [number of values, sum, max], e.g. 'radix_sort.bucket_skew.b10'
+timers: name -> [number of calls, total seconds], filled by phase(name) and add_time
+hooks: functions called as hook(name, event, seconds) when a phase starts ('start', 0) and ends ('end', elapsed)
+
+usage:
+    import instrumentation
+    instrumentation.enable()
+    radix_sort(num_list, 10)
+    print(instrumentation.to_json())
+'''
+
+import json
+import time
+from contextlib import contextmanager
+
+enabled = False
+counters = {}
+stats = {}
+timers = {}
+hooks = {}
+
+
+def enable():
+    '''
+    start recording
+    '''
+    global enabled
+    enabled = True
+
+
+def disable():
+    '''
+    stop recording, what was recorded is kept until reset()
+    '''
+    global enabled
+    enabled = False
+
+
+def reset():
+    '''
+    forget all counters, stats and timers (hooks stay attached)
+    '''
+    counters.clear()
+    stats.clear()
+    timers.clear()
+
+
+def count(name, n=1):
+    '''
+    add n to the counter name
+    time complexity: O(1)
+    '''
+    if enabled:
+        counters[name] = counters.get(name, 0) + n
+
+
+def observe(name, value):
+    '''
+    record one value of name, snapshot reports its count, mean and max
+    time complexity: O(1)
+    '''
+    if enabled:
+        stat = stats.get(name)
+        if stat is None:
+            stats[name] = [1, value, value]
+        else:
+            stat[0] += 1
+            stat[1] += value
+            if value > stat[2]:
+                stat[2] = value
+
+
+def add_time(name, seconds):
+    '''
+    add one call of seconds to the timer name
+    '''
+    if enabled:
+        timer = timers.get(name)
+        if timer is None:
+            timers[name] = [1, seconds]
+        else:
+            timer[0] += 1
+            timer[1] += seconds
+
+
+@contextmanager
+def timed_phase(name):
+    # the context manager used by phase when recording is on
+    for hook in hooks.get(name, ()):
+        hook(name, 'start', 0)
+    start_time = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start_time
+        add_time(name, elapsed)
+        for hook in hooks.get(name, ()):
+            hook(name, 'end', elapsed)
+
+
+class NoPhase(object):
+    # the context manager used by phase when recording is off
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+no_phase = NoPhase()
+
+
+def phase(name):
+    '''
+    context manager that times the block as the timer name and calls the hooks of name
+    e.g. with instrumentation.phase('walk.backtrack'): ...
+    '''
+    if enabled:
+        return timed_phase(name)
+    return no_phase
+
+
+def add_hook(name, hook):
+    '''
+    call hook(name, event, seconds) at the start and end of every phase called name, for profiling one phase
+    '''
+    hooks.setdefault(name, []).append(hook)
+
+
+def remove_hook(name, hook):
+    '''
+    detach a hook added by add_hook
+    '''
+    if hook in hooks.get(name, ()):
+        hooks[name].remove(hook)
+
+
+def snapshot():
+    '''
+    a dictionary copy of everything recorded:
+    {'counters': {name: n}, 'stats': {name: {'count', 'mean', 'max'}}, 'timers': {name: {'calls', 'seconds'}}}
+    '''
+    return {
+        'counters': dict(counters),
+        'stats': {name: {'count': n, 'mean': total / n, 'max': largest} for name, (n, total, largest) in stats.items()},
+        'timers': {name: {'calls': calls, 'seconds': seconds} for name, (calls, seconds) in timers.items()},
+    }
+
+
+def to_json(indent=None):
+    '''
+    snapshot() as a json string
+    '''
+    return json.dumps(snapshot(), indent=indent, sort_keys=True)